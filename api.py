@@ -0,0 +1,77 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Library entry point: a questionnaire pdf to its ESRC dataframe
+    - the pdf is a file name or its content (bytes)
+    - no default paths and no files written: the text stays in memory,
+      only a PageCache or a ParseStore on disk given by the caller writes files
+    - the profile is a Profile of profiles.py or its name
+    engine.py is the same parser for the default questionnaires, with files in and out.
+"""
+
+import os
+
+from engine import get_esrc
+from extract import pdf_text
+from item_store import ItemStore
+from metrics import Metrics
+from profiles import profiles
+from segment import parse_text
+
+
+def get_profile(profile):
+    """
+    Profile, or its name
+    """
+    if isinstance(profile, str):
+        if profile not in profiles:
+            raise ValueError('unknown profile %s, one of %s' % (profile, ', '.join(sorted(profiles))))
+        return profiles[profile]
+    return profile
+
+
+def extract_text(pdf, profile, workers=1, cache=None, metrics=None):
+    """
+    input: pdf file or its content (bytes), profile
+           - workers: processes extracting pages, cache: optional PageCache
+    output: cleaned text, character offset of each page in the text
+    """
+    profile = get_profile(profile)
+    metrics = metrics if metrics is not None else Metrics()
+    metrics.set('profile', profile.name)
+    with metrics.stage('pdf_to_text'):
+        text, page_offsets = pdf_text(pdf, profile, workers=workers, cache=cache)
+    metrics.set('pages', len(page_offsets))
+    metrics.set('pdf_bytes', len(pdf) if isinstance(pdf, bytes) else os.path.getsize(pdf))
+    return text, page_offsets
+
+
+def parse_questionnaire_text(text, profile, page_offsets=(0,), document_order=False, compact=False, store=None, metrics=None):
+    """
+    input: cleaned text (of extract_text), profile, character offset of each page (None: no page info)
+           - document_order: items in the order of the text, with offset, page, section and condition columns
+           - compact: each distinct code list once, questions refer to it by codelist_id
+           - store: optional ParseStore, metrics: optional Metrics
+    output: ESRC dataframe
+    """
+    profile = get_profile(profile)
+    metrics = metrics if metrics is not None else Metrics()
+    sequences, labels, questions, conditions = parse_text(text, profile, store, metrics)
+    with metrics.stage('get_esrc'):
+        if document_order:
+            df_all = ItemStore(sequences, questions, conditions, len(text), page_offsets).to_esrc(compact)
+        else:
+            df_all = get_esrc(sequences, questions, conditions, compact)
+    metrics.set('rows', {str(k): int(v) for k, v in df_all['item_type'].value_counts(sort=False).items()})
+    return df_all
+
+
+def parse_questionnaire(pdf, profile, document_order=False, compact=False, workers=1, cache=None, store=None, metrics=None):
+    """
+    pdf file or its content (bytes) -> ESRC dataframe, see extract_text and parse_questionnaire_text
+    e.g. parse_questionnaire(open('W1.pdf', 'rb').read(), 'elsa_wave1')
+    """
+    metrics = metrics if metrics is not None else Metrics()
+    text, page_offsets = extract_text(pdf, profile, workers, cache, metrics)
+    return parse_questionnaire_text(text, profile, page_offsets, document_order, compact, store, metrics)
@@ -0,0 +1,182 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Parse every questionnaire pdf under a directory
+    - one worker process per document, at most `workers` at a time
+    - a document that fails, crashes or runs over the timeout does not stop the others
+    - progress is kept in a manifest, a rerun only parses unfinished or changed documents
+"""
+
+from pathlib import Path
+from fnmatch import fnmatch
+import multiprocessing
+from multiprocessing.connection import wait
+import argparse
+import os
+import time
+import traceback
+
+from esrc_io import esrc_formats, esrc_path
+from profiles import profiles
+from text_cache import file_state, load_manifest, same_file, save_manifest
+
+
+# first matching file name pattern gives the profile
+profile_rules = [
+    ('*NCDS*', 'ncds'),
+    ('*ELSA*W1*', 'elsa_wave1'),
+    ('*ELSA*W2*', 'elsa_wave2'),
+]
+
+
+def get_profile_name(pdf_file, rules=profile_rules, default=None):
+    name = Path(pdf_file).name
+    for pattern, profile_name in rules:
+        if fnmatch(name, pattern):
+            return profile_name
+    return default
+
+
+def get_job(pdf_file, profile_name):
+    """
+    (profile, input pdf, text file, output directory, ESRC file name) next to the pdf
+    """
+    pdf_file = Path(pdf_file)
+    stem = pdf_file.stem
+    txt_file = pdf_file.with_name(stem + '_all_pages.txt')
+    output_dir = pdf_file.with_name(stem)
+    return (profiles[profile_name], str(pdf_file), str(txt_file), str(output_dir), stem + '_ESRC.csv')
+
+
+def find_pdfs(root):
+    return sorted(str(f) for f in Path(root).glob('**/*.pdf'))
+
+
+def is_finished(entry, pdf_file, profile_name, formats=()):
+    """
+    done before, with the same profile and the same pdf content, and the ESRC file of each format is there
+    """
+    if entry is None or entry.get('status') != 'done' or entry.get('profile') != profile_name:
+        return False
+    if not os.path.exists(entry.get('esrc_file', '')):
+        return False
+    if not all(os.path.exists(esrc_path(entry['esrc_file'], esrc_format)) for esrc_format in formats):
+        return False
+    return same_file(entry, pdf_file)
+
+
+def parse_document(job, conn, metrics=False, formats=()):
+    """
+    worker process: parse one document, send (status, esrc file or error) back
+    metrics: also write a metrics file next to the ESRC file
+    formats: also write the ESRC items as parquet and / or feather
+    """
+    try:
+        from engine import parse_questionnaire, parser_version, metrics_file
+        from metrics import Metrics
+        from parse_store import ParseStore
+        from text_cache import PageCache
+        store = ParseStore(parser_version=parser_version)
+        m = Metrics(job[1])
+        esrc_file = parse_questionnaire(*job, cache=PageCache(), store=store, metrics=m, formats=formats)
+        store.close()
+        if metrics:
+            m.write(metrics_file(esrc_file))
+        conn.send(('done', esrc_file))
+    except Exception:
+        conn.send(('failed', traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def run_batch(root, manifest_file=None, workers=None, timeout=600, default_profile=None, rules=profile_rules, metrics=False, formats=()):
+    """
+    input: root directory of questionnaire pdf files
+           - metrics: write a metrics file next to each ESRC file
+           - formats: also write the ESRC items as parquet and / or feather
+    output: manifest {pdf file: entry}, also saved to manifest_file
+    """
+    manifest_file = manifest_file or os.path.join(root, 'batch_manifest.json')
+    workers = workers or os.cpu_count()
+    manifest = load_manifest(manifest_file)
+
+    pending = []
+    for pdf_file in find_pdfs(root):
+        profile_name = get_profile_name(pdf_file, rules, default_profile)
+        if profile_name is None:
+            print('no profile, skip %s' % pdf_file)
+            continue
+        if is_finished(manifest.get(pdf_file), pdf_file, profile_name, formats):
+            continue
+        pending.append((pdf_file, profile_name))
+
+    ctx = multiprocessing.get_context()
+    running = {}
+    while pending or running:
+        while pending and len(running) < workers:
+            pdf_file, profile_name = pending.pop(0)
+            manifest[pdf_file] = dict(file_state(pdf_file), status='running', profile=profile_name)
+            save_manifest(manifest, manifest_file)
+
+            recv, send = ctx.Pipe(duplex=False)
+            process = ctx.Process(target=parse_document, args=(get_job(pdf_file, profile_name), send, metrics, formats))
+            process.start()
+            send.close()
+            running[process.sentinel] = (process, recv, pdf_file, time.time())
+
+        deadline = min(start for _, _, _, start in running.values()) + timeout
+        ready = wait(list(running), timeout=max(0, deadline - time.time()))
+
+        now = time.time()
+        for sentinel in list(running):
+            process, recv, pdf_file, start = running[sentinel]
+            entry = manifest[pdf_file]
+            if sentinel in ready:
+                process.join()
+                if recv.poll():
+                    status, result = recv.recv()
+                else:
+                    status, result = 'failed', 'worker exited with code %s' % process.exitcode
+            elif now - start > timeout:
+                process.terminate()
+                process.join()
+                status, result = 'timeout', 'over %s seconds' % timeout
+            else:
+                continue
+            recv.close()
+            del running[sentinel]
+
+            entry['status'] = status
+            entry['seconds'] = round(now - start, 3)
+            if status == 'done':
+                entry['esrc_file'] = result
+                entry.pop('error', None)
+            else:
+                entry['error'] = result
+            print('%s %s' % (status, pdf_file))
+            save_manifest(manifest, manifest_file)
+
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse all questionnaire pdf files under a directory')
+    parser.add_argument('root', nargs='?', default='../questionnaire/')
+    parser.add_argument('--manifest', help='default: ROOT/batch_manifest.json')
+    parser.add_argument('--workers', type=int, help='default: number of CPUs')
+    parser.add_argument('--timeout', type=float, default=600, help='seconds per document')
+    parser.add_argument('--profile', choices=sorted(profiles), help='profile for pdf files no rule matches')
+    parser.add_argument('--metrics', action='store_true', help='write a metrics file next to each ESRC file')
+    parser.add_argument('--format', nargs='+', choices=esrc_formats[1:], default=[], dest='formats',
+                        help='also write the ESRC items in these formats (needs pyarrow)')
+    args = parser.parse_args()
+
+    manifest = run_batch(args.root, args.manifest, args.workers, args.timeout, args.profile,
+                         metrics=args.metrics, formats=args.formats)
+    statuses = [entry['status'] for entry in manifest.values()]
+    print(', '.join('%s %d' % (status, statuses.count(status)) for status in sorted(set(statuses))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Benchmark each parsing stage on synthetic questionnaires (synthetic.py)
+    - stages: pdf_to_text (with --pdf), tokenize, get_sequence, get_condition, generate_code_list, get_esrc,
+      get_esrc_compact
+      (get_sequence and get_condition select from the tokens of the one tokenize pass)
+    - wall time (best of --repeat runs) and peak memory (tracemalloc, a separate run)
+    - results are saved as JSON, --check compares them with a baseline and fails on slowdowns
+    - --backends compares the pdf backends: pages per second and how much their text differs
+"""
+
+import argparse
+import difflib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import engine
+import segment
+from pdf_backend import backends
+from profiles import profiles
+from synthetic import synthetic_text, synthetic_pdf
+
+
+default_sizes = [100, 1000, 10000, 100000]
+default_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# a stage is slower if it takes threshold longer than the baseline,
+# and at least min_seconds longer (short stages are mostly noise)
+default_threshold = 0.25
+min_seconds = 0.005
+
+
+def stages(profile, content):
+    """
+    generator of (stage name, function), each stage uses the output of the ones before it
+    """
+    state = {}
+
+    def tokenize():
+        state['tokens'] = list(segment.tokenize(io.StringIO(content), profile))
+
+    def sequence():
+        state['items'] = list(segment.sequence_items(state['tokens']))
+        state['sequences'] = [(text, offset) for item_type, text, offset in state['items'] if item_type == 'sequence']
+        state['labels'] = [text for item_type, text, offset in state['items'] if item_type == 'question_label']
+
+    def condition():
+        state['conditions'] = list(segment.condition_items(state['tokens']))
+
+    def code_list():
+        state['questions'] = list(segment.generate_code_list(content, state['labels'], profile))
+
+    def esrc():
+        state['esrc'] = engine.get_esrc(state['sequences'], state['questions'], state['conditions'])
+
+    def esrc_compact():
+        state['esrc_compact'] = engine.get_esrc(state['sequences'], state['questions'], state['conditions'], compact=True)
+
+    yield 'tokenize', tokenize
+    yield 'get_sequence', sequence
+    yield 'get_condition', condition
+    yield 'generate_code_list', code_list
+    yield 'get_esrc', esrc
+    yield 'get_esrc_compact', esrc_compact
+
+
+def measure(run, repeat):
+    """
+    best wall time of repeat runs, peak traced memory of one more run
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': round(min(seconds), 6), 'peak_bytes': peak}
+
+
+def bench_text(profile, n_questions, repeat=3):
+    """
+    input: profile, number of questions
+    output: {stage: {'seconds', 'peak_bytes'}}
+    """
+    content = synthetic_text(profile.name, n_questions)
+    result = {}
+    for name, run in stages(profile, content):
+        result[name] = measure(run, repeat)
+    return result
+
+
+def bench_pdf(profile, n_questions, repeat=1, workers=1):
+    """
+    pdf_to_text on a synthetic pdf, without page cache
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_file = synthetic_pdf(profile, n_questions, os.path.join(tmp, 'synthetic.pdf'))
+        txt_file = os.path.join(tmp, 'synthetic.txt')
+        return measure(lambda: engine.pdf_to_text(pdf_file, txt_file, profile, workers=workers), repeat)
+
+
+def compare_backends(profile, pdf_file, names):
+    """
+    pdf_to_text with each backend, without page cache
+    output: {backend: {'seconds', 'pages_per_second', 'lines', 'labels', 'changed_lines', 'similarity'}},
+            changed_lines and similarity against the first backend
+    """
+    result = {}
+    first = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in names:
+            txt_file = os.path.join(tmp, name + '.txt')
+            start = time.perf_counter()
+            pages = len(engine.pdf_to_text(pdf_file, txt_file, profile, backend=name))
+            seconds = time.perf_counter() - start
+            with open(txt_file, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            labels = sum(1 for item in segment.get_sequence((line + '\n' for line in lines), profile) if item[0] == 'question_label')
+            r = {'seconds': round(seconds, 6), 'pages': pages, 'pages_per_second': round(pages / seconds, 2),
+                 'lines': len(lines), 'labels': labels}
+            if first is None:
+                first = lines
+            else:
+                matcher = difflib.SequenceMatcher(None, first, lines, autojunk=False)
+                r['changed_lines'] = sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal')
+                r['similarity'] = round(matcher.ratio(), 4)
+            result[name] = r
+    return result
+
+
+def run_backend_comparison(profile_names, names, sizes=(100,), pdf_files=()):
+    """
+    compare backends on synthetic pdf files of each profile and size, and on pdf_files
+    output: {document: {backend: comparison}}
+    """
+    from batch import get_profile_name
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile_name in profile_names:
+            for n in sizes:
+                print('backends %s %d questions' % (profile_name, n), file=sys.stderr)
+                pdf_file = synthetic_pdf(profiles[profile_name], n, os.path.join(tmp, '%s_%d.pdf' % (profile_name, n)))
+                results['synthetic %s %d' % (profile_name, n)] = compare_backends(profiles[profile_name], pdf_file, names)
+    for pdf_file in pdf_files:
+        profile_name = get_profile_name(pdf_file)
+        if profile_name is None:
+            print('no profile, skip %s' % pdf_file, file=sys.stderr)
+            continue
+        print('backends %s' % pdf_file, file=sys.stderr)
+        results[pdf_file] = compare_backends(profiles[profile_name], pdf_file, names)
+    return results
+
+
+def print_backends(comparison):
+    print('%-40s %-9s %8s %10s %8s %8s %8s %10s' % ('document', 'backend', 'seconds', 'pages/s', 'lines', 'labels', 'changed', 'similarity'))
+    for document, result in comparison.items():
+        for name, r in result.items():
+            print('%-40s %-9s %8.3f %10.1f %8d %8d %8s %10s' % (document[-40:], name, r['seconds'], r['pages_per_second'],
+                  r['lines'], r['labels'], r.get('changed_lines', ''), r.get('similarity', '')))
+
+
+def run_benchmarks(profile_names, sizes, repeat=3, pdf_sizes=()):
+    """
+    output: {'environment': ..., 'results': {profile: {size: {stage: measurement}}}}
+    """
+    results = {}
+    for name in profile_names:
+        results[name] = {}
+        for n in sizes:
+            print('%s %d questions' % (name, n), file=sys.stderr)
+            result = bench_text(profiles[name], n, repeat if n < 100000 else 1)
+            if n in pdf_sizes:
+                result['pdf_to_text'] = bench_pdf(profiles[name], n)
+            results[name][str(n)] = result
+    return {
+        'environment': {'python': platform.python_version(), 'machine': platform.machine(),
+                        'cpus': os.cpu_count(), 'time': time.strftime('%Y-%m-%d %H:%M:%S')},
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold=default_threshold):
+    """
+    input: benchmark results, baseline results
+    output: list of (profile, size, stage, baseline seconds, seconds) slower than the threshold,
+            baseline seconds None for a stage the baseline of that profile and size does not have
+    """
+    slower = []
+    for name, sizes in results['results'].items():
+        for n, result in sizes.items():
+            if n not in baseline['results'].get(name, {}):
+                continue
+            for stage, m in result.items():
+                old = baseline['results'][name][n].get(stage)
+                if old is None:
+                    # a new stage: the baseline was not saved again when the stages changed
+                    slower.append((name, n, stage, None, m['seconds']))
+                    continue
+                if m['seconds'] > old['seconds'] * (1 + threshold) and m['seconds'] - old['seconds'] > min_seconds:
+                    slower.append((name, n, stage, old['seconds'], m['seconds']))
+    return slower
+
+
+def print_results(results, baseline=None):
+    print('%-11s %7s %-19s %10s %10s %12s' % ('profile', 'size', 'stage', 'seconds', 'baseline', 'peak MB'))
+    for name, sizes in results['results'].items():
+        for n, result in sizes.items():
+            for stage, m in result.items():
+                old = ((baseline or {}).get('results', {}).get(name, {}).get(n, {}).get(stage) or {}).get('seconds')
+                print('%-11s %7s %-19s %10.4f %10s %12.1f' % (name, n, stage, m['seconds'],
+                      '' if old is None else '%.4f' % old, m['peak_bytes'] / 2**20))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the parsing stages on synthetic questionnaires')
+    parser.add_argument('--profiles', nargs='+', choices=sorted(profiles), default=sorted(profiles))
+    parser.add_argument('--sizes', nargs='+', type=int, default=default_sizes, help='numbers of questions')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage, the best one counts')
+    parser.add_argument('--pdf', nargs='*', type=int, metavar='SIZE',
+                        help='also time pdf_to_text for these sizes (default 100 and 1000, needs reportlab)')
+    parser.add_argument('--backends', nargs='*', metavar='PDF',
+                        help='compare the pdf backends on synthetic pdf files (--pdf sizes, default 100) and these pdf files')
+    parser.add_argument('--backend-names', nargs='+', choices=sorted(backends), default=['layout', 'simple', 'pdfminer'],
+                        help='the first one is the reference for the differences')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=default_baseline)
+    parser.add_argument('--save-baseline', action='store_true', help='write the results to the baseline file')
+    parser.add_argument('--check', action='store_true', help='exit with 1 if a stage is slower than the baseline')
+    parser.add_argument('--threshold', type=float, default=default_threshold, help='allowed slowdown, 0.25 is 25%%')
+    args = parser.parse_args()
+
+    pdf_sizes = [] if args.pdf is None else (args.pdf or [100, 1000])
+    results = run_benchmarks(args.profiles, args.sizes, args.repeat, pdf_sizes)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.backends is not None:
+        results['backends'] = run_backend_comparison(args.profiles, args.backend_names, args.pdf or [100], args.backends)
+        print_backends(results['backends'])
+
+    for output in [args.output, args.baseline if args.save_baseline else None]:
+        if output:
+            with open(output, 'w') as f:
+                json.dump(results, f, indent=1)
+
+    if args.check:
+        if baseline is None:
+            sys.exit('no baseline %s' % args.baseline)
+        slower = compare(results, baseline, args.threshold)
+        for name, n, stage, old, new in slower:
+            if old is None:
+                print('no baseline: %s %s %s, save it again with --save-baseline' % (name, n, stage))
+            else:
+                print('slower: %s %s %s %.4f -> %.4f seconds (%+.0f%%)' % (name, n, stage, old, new, 100 * (new / old - 1)))
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
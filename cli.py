@@ -0,0 +1,223 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    One command line for the parsing stages, each stage imports only what it needs
+    - extract:  pdf -> cleaned text (*_all_pages.txt) and page offsets (*_pages.json), no pandas
+    - segment:  cleaned text -> records (*_segments.jsonl, segment.py), no pandas
+    - assemble: records -> ESRC file (*_ESRC.csv, parquet / feather), imports pandas
+    - relabel:  ESRC files -> relabelled files or a sharded dataset (modify.py), imports pandas
+    pandas, numpy and pdfplumber are imported by the stage that uses them, `--help` imports none of them.
+    --metrics FILE writes the metrics of the stage, with the import time of the modules it loaded
+    (import_seconds) and whether pandas was imported (pandas_imported).
+"""
+
+import time
+
+started = time.perf_counter()
+
+import argparse
+import importlib
+import json
+import os
+import sys
+
+from esrc_io import esrc_formats, extensions
+from metrics import Metrics
+
+# import time of the modules above
+cli_import_seconds = time.perf_counter() - started
+
+# library of each pdf backend (pdf_backend.py), imported before the pages are extracted
+backend_modules = {'layout': 'pdfplumber', 'simple': 'pdfplumber', 'pdfminer': 'pdfminer.pdfpage'}
+
+
+def load(name, metrics):
+    """
+    import a module when its stage runs, the time it took goes to the metrics
+    """
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    metrics.counters.setdefault('import_seconds', {})[name] = round(time.perf_counter() - start, 6)
+    return module
+
+
+def next_to(path, suffix, old=''):
+    """
+    file next to path: its name without the extension and the old ending, then suffix
+    """
+    base = os.path.splitext(path)[0]
+    if old and base.endswith(old):
+        base = base[:-len(old)]
+    return base + suffix
+
+
+def get_profile(name, path, metrics):
+    """
+    profile by name, or from the file name (batch.profile_rules)
+    """
+    profiles = load('profiles', metrics).profiles
+    name = name or load('batch', metrics).get_profile_name(path)
+    if name not in profiles:
+        sys.exit('%s: no profile, use --profile %s' % (path, '|'.join(sorted(profiles))))
+    return profiles[name]
+
+
+def extract(args, metrics):
+    """
+    pdf -> cleaned text file, page offsets file
+    """
+    profile = get_profile(args.profile, args.pdf, metrics)
+    pdf_to_text = load('extract', metrics).pdf_to_text
+    PageCache = load('text_cache', metrics).PageCache
+    backend = args.backend or profile.pdf_backend
+    load(backend_modules[backend], metrics)
+    txt_file = args.output or next_to(args.pdf, '_all_pages.txt')
+    metrics.set('profile', profile.name)
+    with metrics.stage('pdf_to_text'):
+        page_offsets = pdf_to_text(args.pdf, txt_file, profile, workers=args.workers or os.cpu_count(),
+                                   cache=None if args.no_cache else PageCache(), backend=backend)
+    metrics.set('pages', len(page_offsets))
+    metrics.set('pdf_bytes', os.path.getsize(args.pdf))
+    pages_file = next_to(txt_file, '_pages.json', '_all_pages')
+    with open(pages_file, 'w') as f:
+        json.dump({'document': os.path.splitext(os.path.basename(args.pdf))[0], 'profile': profile.name,
+                   'page_offsets': page_offsets}, f)
+    return txt_file
+
+
+def segment(args, metrics):
+    """
+    cleaned text file -> segments file
+    """
+    pages_file = args.pages or next_to(args.txt, '_pages.json', '_all_pages')
+    pages = {}
+    if os.path.exists(pages_file):
+        with open(pages_file) as f:
+            pages = json.load(f)
+    profile = get_profile(args.profile or pages.get('profile'), args.txt, metrics)
+    seg = load('segment', metrics)
+    TextStore = load('text_store', metrics).TextStore
+    store = None
+    if not args.no_store:
+        store = load('parse_store', metrics).ParseStore(parser_version=seg.parser_version)
+    output = args.output or next_to(args.txt, '_segments.jsonl', '_all_pages')
+    metrics.set('profile', profile.name)
+
+    with metrics.stage('read_text'):
+        content = TextStore(args.txt)
+    metrics.set('text_bytes', content.size)
+    sequences, labels, questions, conditions = seg.parse_text(content, profile, store, metrics)
+    header = {'document': pages.get('document', os.path.splitext(os.path.basename(args.txt))[0]),
+              'profile': profile.name, 'text_length': len(content), 'page_offsets': pages.get('page_offsets', [0])}
+    content.close()
+    with metrics.stage('write_segments'):
+        seg.write_segments(output, sequences, labels, questions, conditions, header)
+    return output
+
+
+def assemble(args, metrics):
+    """
+    segments file -> ESRC file, and the other formats
+    """
+    seg = load('segment', metrics)
+    with metrics.stage('read_segments'):
+        header, sequences, labels, questions, conditions = seg.read_segments(args.segments)
+    engine = load('engine', metrics)
+    esrc_io = load('esrc_io', metrics)
+    esrc_file = args.output or next_to(args.segments, '_ESRC.csv', '_segments')
+    metrics.set('profile', header['profile'])
+
+    with metrics.stage('get_esrc'):
+        if args.document_order:
+            item_store = load('item_store', metrics)
+            df_all = item_store.ItemStore(sequences, questions, conditions, header['text_length'], header['page_offsets']).to_esrc(args.compact)
+        else:
+            df_all = engine.get_esrc(sequences, questions, conditions, args.compact)
+    with metrics.stage('write_esrc'):
+        esrc_io.write_esrc(df_all, esrc_file)
+    for esrc_format in args.formats:
+        with metrics.stage('write_esrc_' + esrc_format):
+            esrc_io.write_esrc(df_all, esrc_io.esrc_path(esrc_file, esrc_format), esrc_format, header['document'])
+    metrics.set('rows', {str(k): int(v) for k, v in df_all['item_type'].value_counts(sort=False).items()})
+    return esrc_file
+
+
+def relabel(args, metrics):
+    """
+    ESRC files -> relabelled files, or one sharded dataset
+    """
+    modify = load('modify', metrics)
+    if args.dataset:
+        with metrics.stage('write_dataset'):
+            index = modify.write_dataset(args.root, args.dataset, args.workers, args.shard_rows, args.shard_bytes, args.shard_format)
+        metrics.set('documents', len(index['documents']))
+        metrics.set('shards', len(index['shards']))
+        return args.dataset
+    with metrics.stage('modify'):
+        output_files = modify.run_modify(args.root, args.outdir, args.workers, args.manifest, args.force)
+    metrics.set('files', len(output_files))
+    return '\n'.join(output_files)
+
+
+def main(argv=None):
+    """
+    python3 cli.py {extract,segment,assemble,relabel} ... [--metrics FILE]
+    """
+    parser = argparse.ArgumentParser(description='Parse questionnaires one stage at a time')
+    stages = parser.add_subparsers(dest='stage', required=True)
+
+    p = stages.add_parser('extract', help='pdf -> cleaned text and page offsets')
+    p.add_argument('pdf')
+    p.add_argument('--output', help='text file, default: PDF_all_pages.txt')
+    p.add_argument('--profile', help='default: from the file name')
+    p.add_argument('--workers', type=int, help='default: number of CPUs')
+    p.add_argument('--backend', choices=sorted(backend_modules), help='pdf backend, default: the one of the profile')
+    p.add_argument('--no-cache', action='store_true', help='do not use the page cache')
+    p.set_defaults(run=extract)
+
+    p = stages.add_parser('segment', help='cleaned text -> records (JSONL), without pandas')
+    p.add_argument('txt')
+    p.add_argument('--output', help='default: NAME_segments.jsonl next to the text file')
+    p.add_argument('--pages', help='page offsets of extract, default: NAME_pages.json next to the text file')
+    p.add_argument('--profile', help='default: the one of extract, or from the file name')
+    p.add_argument('--no-store', action='store_true', help='do not use the parse store')
+    p.set_defaults(run=segment)
+
+    p = stages.add_parser('assemble', help='records -> ESRC file')
+    p.add_argument('segments')
+    p.add_argument('--output', help='default: NAME_ESRC.csv next to the segments file')
+    p.add_argument('--document-order', action='store_true', help='items in the order of the text, with offset columns')
+    p.add_argument('--compact', action='store_true', help='each distinct code list once, referred to by codelist_id')
+    p.add_argument('--format', nargs='+', choices=esrc_formats[1:], default=[], dest='formats',
+                   help='also write the ESRC items in these formats (needs pyarrow)')
+    p.set_defaults(run=assemble)
+
+    p = stages.add_parser('relabel', help='ESRC files -> relabelled files or a sharded dataset (modify.py)')
+    p.add_argument('root', nargs='?', default='../questionnaire/')
+    p.add_argument('--outdir', default='../2021_12_13')
+    p.add_argument('--workers', type=int, help='default: number of CPUs')
+    p.add_argument('--manifest', help='default: OUTDIR/modify_manifest.json')
+    p.add_argument('--force', action='store_true', help='write all files, changed or not')
+    p.add_argument('--dataset', metavar='DIR', help='write one sharded dataset to DIR instead of a file per questionnaire')
+    p.add_argument('--shard-rows', type=int, default=1000000)
+    p.add_argument('--shard-bytes', type=int, help='also cut shards at this many bytes of text')
+    p.add_argument('--shard-format', choices=sorted(extensions), default='parquet')
+    p.set_defaults(run=relabel)
+
+    for p in stages.choices.values():
+        p.add_argument('--metrics', help='write the metrics of the stage to this JSON file, .jsonl: append a line')
+
+    args = parser.parse_args(argv)
+    metrics = Metrics(getattr(args, 'pdf', None) or getattr(args, 'txt', None) or getattr(args, 'segments', None) or args.root)
+    metrics.counters['import_seconds'] = {'cli': round(cli_import_seconds, 6)}
+    with metrics.stage(args.stage):
+        output = args.run(args, metrics)
+    metrics.set('pandas_imported', 'pandas' in sys.modules)
+    if args.metrics:
+        metrics.write(args.metrics)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
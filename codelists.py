@@ -0,0 +1,73 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Interned code lists
+    - the same ordered (value, category) list is kept once, as a tuple of CodeItem,
+      all questions with it share that tuple
+    - each list has a stable id, a hash of its content: the same list has the same id in every
+      document and every run
+    The compact ESRC output references code lists by id and has the code_list rows of each list once.
+"""
+
+from functools import partial
+import hashlib
+import json
+
+from records import CodeItem
+
+
+# CodeItem from a (value, category) pair, without a Python call
+code_item = partial(tuple.__new__, CodeItem)
+
+
+def codelist_id(codes):
+    """
+    stable id of a code list, '' for no codes
+    """
+    if not codes:
+        return ''
+    return 'cl_' + hashlib.sha1(json.dumps(list(codes), ensure_ascii=False).encode('utf-8')).hexdigest()[:12]
+
+
+def code_line(value, cat):
+    """
+    ESRC code_list content of one code
+    """
+    return '%4d, %s' % (value, cat) if cat else '%4d' % value
+
+
+class CodeLists:
+
+    def __init__(self):
+        # the shared tuple of CodeItem -> itself, found with any equal tuple of (value, category)
+        self.lists = {}
+        # id() of a shared tuple -> its codelist id, once asked for
+        self.ids = {}
+
+    def intern(self, codes):
+        """
+        input: [(value, category)] or CodeItems
+        output: the shared tuple of CodeItem of this code list
+        """
+        codes = tuple(codes)
+        shared = self.lists.get(codes)
+        if shared is None:
+            # a code list of another table is shared as it is
+            if not codes or type(codes[0]) is not CodeItem:
+                codes = tuple(map(code_item, codes))
+            shared = self.lists[codes] = codes
+        return shared
+
+    def id(self, codes):
+        # shared tuples are kept in self.lists, their id() is not reused
+        list_id = self.ids.get(id(codes))
+        if list_id is None:
+            codes = self.intern(codes)
+            list_id = self.ids.get(id(codes))
+            if list_id is None:
+                list_id = self.ids[id(codes)] = codelist_id(codes)
+        return list_id
+
+    def __len__(self):
+        return len(self.lists)
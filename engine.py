@@ -0,0 +1,312 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Parse questionnaire pdf files directly to ESRC format, no order needed
+    - one engine for all surveys, the differences are in profiles.py
+    - any number of questionnaires in one process
+    - the pdf extraction is in extract.py and the text parsing in segment.py, both without pandas,
+      this module makes the ESRC table of the records
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import argparse
+from collections import defaultdict
+
+from codelists import CodeLists, code_line
+from esrc_io import esrc_formats, esrc_path, write_esrc
+from extract import rreplace, clean_page, pdf_to_text
+from item_store import ItemStore
+from metrics import Metrics, profilers
+from profiles import profiles, NCDS, ELSA_WAVE_1, ELSA_WAVE_2
+from parse_store import ParseStore
+from pipeline import pipeline
+from segment import (parser_version, get_sequence, sequence_items, get_condition, condition_items,
+                     get_question_code_from_questionpair, parse_question_span, generate_code_list,
+                     parse_text, write_debug_files)
+from text_cache import PageCache
+from text_store import TextStore
+
+
+# profile, input pdf, text file, output directory, ESRC file name
+questionnaires = [
+    (NCDS,
+     '../questionnaire/NCDS-Age-42/NCDS-Age-42-Questionnaire.pdf',
+     '../questionnaire/NCDS-Age-42/NCDS-Age-42-Questionnaire_all_pages.txt',
+     '../questionnaire/NCDS-Age-42/NCDS',
+     'NCDS_Age_42_ESRC.csv'),
+    (ELSA_WAVE_1,
+     '../questionnaire/ELSA_questionnaire/ELSA_Questionnaire_W1.pdf',
+     '../questionnaire/ELSA_questionnaire/ELSA_W1_all_pages.txt',
+     '../questionnaire/ELSA_questionnaire/wave_1',
+     'ELSA_wave1_ESRC.csv'),
+    (ELSA_WAVE_2,
+     '../questionnaire/ELSA_questionnaire/ELSA_Nurse_Questionnaire_W2.pdf',
+     '../questionnaire/ELSA_questionnaire/ELSA_Nurse_Questionnaire_W2_all_pages.txt',
+     '../questionnaire/ELSA_questionnaire/wave_2',
+     'ELSA_Nurse_Questionnaire_W2_ESRC.csv'),
+]
+
+
+def question_rows(questions):
+    """
+    ESRC rows of the question records, code lists merged on each question then made unique
+    the rows the left merges of the question, instruction, response and code list tables on the label gave,
+    built from the records: empty text is missing, empty labels match each other but no response
+    """
+    nan = np.nan
+    questions = list(questions)
+    same_label = defaultdict(list)
+    for q in questions:
+        same_label[q.label].append(q)
+
+    # code_list content of each shared code list
+    code_lines = {}
+    # merged rows so far of each label of more questions
+    seen_rows = defaultdict(set)
+
+    # merged rows: label, literal, instruction, response, code_list, position among all merged rows
+    labels, literals, instructions, responses, code_list = [], [], [], [], []
+    positions = []
+    position = 0
+    for q in questions:
+        label = q.label or nan
+        literal = q.question or nan
+        same = same_label[q.label]
+        if len(same) == 1:
+            # a label of one question: a row per code, no duplicates
+            lines = code_lines.get(id(q.codes))
+            if lines is None:
+                lines = code_lines[id(q.codes)] = [code_line(value, cat) for value, cat in q.codes] or ['']
+            k = len(lines)
+            labels += [label] * k
+            literals += [literal] * k
+            instructions += [q.instruction or nan] * k
+            responses += [q.response if q.response != '' and q.label != '' else nan] * k
+            code_list += lines
+            positions += range(position, position + k)
+            position += k
+            continue
+        # a label of more questions: each question of the label with each instruction,
+        # response and code of the label, without duplicate rows
+        same_responses = [r.response for r in same if r.response != '' and q.label != ''] or [nan]
+        same_codes = [('%4d' % value, cat or nan, j) for r in same for j, (value, cat) in enumerate(r.codes)] or [(nan, nan, nan)]
+        seen = seen_rows[q.label]
+        for r in same:
+            instruction = r.instruction or nan
+            for response in same_responses:
+                for value, cat, j in same_codes:
+                    row = (literal, instruction, response, value, cat, j)
+                    if row not in seen:
+                        seen.add(row)
+                        labels.append(label)
+                        literals.append(literal)
+                        instructions.append(instruction)
+                        responses.append(response)
+                        code_list.append('' if value is nan else value if cat is nan else value + ', ' + cat)
+                        positions.append(position)
+                    position += 1
+
+    # long format, one row per question row and item type, in the same order melt + sort_index gave:
+    # pandas sorts the index with the (not stable) numpy quicksort
+    item_types = np.array(['question_name', 'question', 'instruction', 'response', 'code_list'], dtype=object)
+    n = len(positions)
+    index = np.tile(np.array(positions, dtype=np.int64), len(item_types))
+    order = np.argsort(index, kind='quicksort') if n > 1 else np.arange(len(index))
+    content = np.array(labels + literals + instructions + responses + code_list, dtype=object)[order]
+    item_type = np.repeat(item_types, n)[order]
+
+    df_question_m = pd.DataFrame({'item_type': item_type, 'content': content})
+    df_question_m = df_question_m[df_question_m['content'].notna() & (df_question_m['content'] != '')]
+    # no dup
+    return df_question_m.drop_duplicates(keep='first')
+
+
+def question_rows_compact(questions):
+    """
+    ESRC rows of the question records, code lists by id (codelists.py):
+    the question_name row has the codelist_id, the code_list rows of each distinct list
+    are only there once, after the first question with that list
+    """
+    codelists = CodeLists()
+    seen = set()
+    rows = []
+    for label, question, instruction, codes, response, offset in questions:
+        list_id = codelists.id(codes)
+        if label:
+            rows.append(('question_name', label, list_id))
+        for item_type, content in [('question', question), ('instruction', instruction), ('response', response)]:
+            if content:
+                rows.append((item_type, content, ''))
+        if list_id and list_id not in seen:
+            seen.add(list_id)
+            rows.extend(('code_list', code_line(value, cat), list_id) for value, cat in codes)
+    df = pd.DataFrame(rows, columns=['item_type', 'content', 'codelist_id'])
+    return df.drop_duplicates(keep='first')
+
+
+def get_esrc(sequences, questions, conditions, compact=False):
+    """
+    input: sequences, question records from generate_code_list, conditions and loops from get_condition
+           - compact: each distinct code list once, questions refer to it by a codelist_id column
+    output: ESRC dataframe (item_type, content)
+    """
+    df_sequence = pd.DataFrame({'item_type': 'sequence', 'content': pd.Series([text for text, offset in sequences], dtype=object)})
+    df_question_m = question_rows_compact(questions) if compact else question_rows(questions)
+
+    # condition and loop
+    condition = [text for item_type, text, offset in conditions if item_type == 'condition']
+    df_condition = pd.DataFrame({'item_type': 'condition (' + pd.Series(condition, dtype=object).str.split(' ').str[0].str.lower() + ')', 'content': condition})
+    df_loop = pd.DataFrame({'item_type': 'condition (loop)', 'content': [text for item_type, text, offset in conditions if item_type == 'loop']})
+
+    #combine
+    df_all = pd.concat([df_sequence, df_question_m, df_condition, df_loop], ignore_index=True)
+    df_all['item_type'] = df_all['item_type'].astype('category')
+    if compact:
+        df_all['codelist_id'] = df_all['codelist_id'].fillna('')
+    return df_all
+
+
+def extract_questionnaire(profile, input_pdf, txt_file, workers=1, cache=None, metrics=None):
+    """
+    pdf -> cleaned text file, the first stage of parse_questionnaire
+    output: character offset of each page in the text
+    """
+    metrics = metrics or Metrics(input_pdf)
+    metrics.set('profile', profile.name)
+    with metrics.stage('pdf_to_text'):
+        page_offsets = pdf_to_text(input_pdf, txt_file, profile, workers=workers, cache=cache)
+    metrics.set('pages', len(page_offsets))
+    metrics.set('pdf_bytes', os.path.getsize(input_pdf))
+    return page_offsets
+
+
+def parse_questionnaire(profile, input_pdf, txt_file, output_dir, esrc_name, debug=False, workers=1, cache=None, store=None, document_order=False, metrics=None, formats=(), page_offsets=None, compact=False):
+    """
+    pdf -> cleaned text -> ESRC file in output_dir
+    debug: also write the intermediate files to the output directory
+    cache: PageCache for pdf pages, store: ParseStore for question spans
+    document_order: items in the order of the text, with offset, page, section and condition columns
+    metrics: Metrics, filled with the time of each stage and the counters
+    formats: 'parquet' and / or 'feather', also written next to the ESRC (TSV) file
+    page_offsets: txt_file was already extracted by extract_questionnaire, start from the text
+    compact: each distinct code list once in the ESRC file, questions refer to it by codelist_id
+    """
+    metrics = metrics or Metrics(input_pdf)
+
+    # pdf to text
+    if page_offsets is None:
+        page_offsets = extract_questionnaire(profile, input_pdf, txt_file, workers, cache, metrics)
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    esrc_file = os.path.join(output_dir, esrc_name)
+
+    # one read-only mapping of the text for all stages
+    with metrics.stage('read_text'):
+        content = TextStore(txt_file)
+    metrics.set('text_bytes', content.size)
+
+    sequences, labels, questions, conditions = parse_text(content, profile, store, metrics)
+
+    if debug:
+        with metrics.stage('write_debug_files'):
+            write_debug_files(output_dir, sequences, labels, questions, conditions)
+
+    # combine to get ESRC format
+    with metrics.stage('get_esrc'):
+        if document_order:
+            df_all = ItemStore(sequences, questions, conditions, len(content), page_offsets).to_esrc(compact)
+        else:
+            df_all = get_esrc(sequences, questions, conditions, compact)
+    content.close()
+    with metrics.stage('write_esrc'):
+        write_esrc(df_all, esrc_file)
+    # document id: the pdf file name
+    document = os.path.splitext(os.path.basename(input_pdf))[0]
+    for esrc_format in formats:
+        with metrics.stage('write_esrc_' + esrc_format):
+            write_esrc(df_all, esrc_path(esrc_file, esrc_format), esrc_format, document)
+    metrics.set('rows', {str(k): int(v) for k, v in df_all['item_type'].value_counts(sort=False).items()})
+    return esrc_file
+
+
+def metrics_file(esrc_file, suffix='_metrics.json'):
+    """
+    metrics file next to the ESRC file
+    """
+    return os.path.splitext(esrc_file)[0] + suffix
+
+
+def process_questionnaires(jobs, debug=False, workers=None, cache=None, store=None, document_order=False,
+                           metrics=False, metrics_log=None, profile_stage=None, profiler='cprofile', formats=(), depth=1, compact=False):
+    """
+    input: list of (profile, input pdf, text file, output directory, ESRC file name)
+           - metrics: write a metrics JSON file next to each ESRC file
+           - metrics_log: also append the metrics of each document to this JSONL file
+           - profile_stage, profiler: run this stage under cProfile (stats next to the ESRC file) or tracemalloc
+           - formats: also write the ESRC items as parquet and / or feather
+           - depth: documents extracted ahead while the current one is parsed (pipeline.py),
+             0 to extract and parse one document after the other
+           - compact: code lists by id, each distinct list once
+    output: list of ESRC files, written in the order of the jobs
+    profiles are compiled once, at import, and shared by all jobs
+    """
+    workers = workers or os.cpu_count()
+    cache = cache or PageCache()
+    store = store or ParseStore(parser_version=parser_version)
+
+    def extract(job):
+        profile_file = metrics_file(os.path.join(job[3], job[4]), '_%s.prof' % profile_stage)
+        m = Metrics(job[1], profile_stage, profiler, profile_file)
+        return m, extract_questionnaire(*job[:3], workers=workers, cache=cache, metrics=m)
+
+    if depth > 0:
+        extracted = pipeline(jobs, extract, depth)
+    else:
+        extracted = ((job, extract(job)) for job in jobs)
+
+    esrc_files = []
+    for job, (m, page_offsets) in extracted:
+        esrc_file = parse_questionnaire(*job, debug=debug, workers=workers, store=store, document_order=document_order,
+                                        metrics=m, formats=formats, page_offsets=page_offsets, compact=compact)
+        if metrics:
+            m.write(metrics_file(esrc_file))
+        if metrics_log:
+            m.write(metrics_log)
+        esrc_files.append(esrc_file)
+    return esrc_files
+
+
+def main():
+    """
+    python3 engine.py [profile name ...] [--metrics] [--profile-stage STAGE] [--format parquet feather]
+    parse the default questionnaires, all of them or only the named profiles
+    """
+    parser = argparse.ArgumentParser(description='Parse the default questionnaires')
+    parser.add_argument('names', nargs='*', metavar='profile', help='%s, default: all' % ', '.join(sorted(profiles)))
+    parser.add_argument('--metrics', action='store_true', help='write a metrics file next to each ESRC file')
+    parser.add_argument('--metrics-log', help='append the metrics of each document to this JSONL file')
+    parser.add_argument('--profile-stage', help='e.g. pdf_to_text, generate_code_list, get_esrc')
+    parser.add_argument('--profiler', choices=profilers, default='cprofile')
+    parser.add_argument('--format', nargs='+', choices=esrc_formats[1:], default=[], dest='formats',
+                        help='also write the ESRC items in these formats (needs pyarrow)')
+    parser.add_argument('--depth', type=int, default=1, help='documents extracted ahead while one is parsed, 0: no pipeline')
+    parser.add_argument('--compact', action='store_true', help='each distinct code list once, referred to by codelist_id')
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in profiles:
+            parser.error('unknown profile %s' % name)
+
+    names = args.names or list(profiles)
+    jobs = [job for job in questionnaires if job[0].name in names]
+    for esrc_file in process_questionnaires(jobs, metrics=args.metrics, metrics_log=args.metrics_log,
+                                            profile_stage=args.profile_stage, profiler=args.profiler, formats=args.formats, depth=args.depth,
+                                            compact=args.compact):
+        print(esrc_file)
+
+
+if __name__ == "__main__":
+    main()
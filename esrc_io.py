@@ -0,0 +1,82 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    ESRC files: the TSV file, and the same items as Parquet or Feather next to it
+    - tsv:     NCDS_Age_42_ESRC.csv, tab separated (the original format)
+    - parquet: NCDS_Age_42_ESRC.parquet
+    - feather: NCDS_Age_42_ESRC.feather
+    The columnar files keep item_type categorical and add a categorical document column,
+    with the offset, page, section and condition columns when the items are in document order.
+    They are read back without parsing any text; Parquet and Feather need pyarrow.
+    pandas is imported when a file is read, writing gets the dataframe from the caller.
+"""
+
+import os
+
+
+esrc_formats = ('tsv', 'parquet', 'feather')
+extensions = {'tsv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+
+# columns of the columnar files that are categorical
+categorical = ['item_type', 'document', 'section']
+
+
+def esrc_path(esrc_file, esrc_format):
+    """
+    the file of this format next to the ESRC (TSV) file
+    """
+    return os.path.splitext(esrc_file)[0] + extensions[esrc_format]
+
+
+def esrc_format_of(path):
+    """
+    format of an ESRC file from its extension, tsv for anything else
+    """
+    ext = os.path.splitext(path)[1].lower()
+    for esrc_format, e in extensions.items():
+        if ext == e and esrc_format != 'tsv':
+            return esrc_format
+    return 'tsv'
+
+
+def columnar(df, document=None):
+    """
+    ESRC dataframe -> dataframe for Parquet / Feather: categorical columns, document id, default index
+    """
+    df = df.reset_index(drop=True)
+    if document is not None:
+        df.insert(0, 'document', document)
+    for column in categorical:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df
+
+
+def write_esrc(df, path, esrc_format='tsv', document=None):
+    """
+    input: ESRC dataframe, output file, format, document id (columnar formats only)
+    output: path
+    """
+    if esrc_format == 'tsv':
+        df.to_csv(path, sep='\t', index=False)
+    elif esrc_format == 'parquet':
+        columnar(df, document).to_parquet(path, index=False)
+    elif esrc_format == 'feather':
+        columnar(df, document).to_feather(path)
+    else:
+        raise ValueError('unknown ESRC format %s, one of %s' % (esrc_format, ', '.join(esrc_formats)))
+    return path
+
+
+def read_esrc(path):
+    """
+    ESRC file of any format, by its extension
+    """
+    import pandas as pd
+    esrc_format = esrc_format_of(path)
+    if esrc_format == 'parquet':
+        return pd.read_parquet(path)
+    if esrc_format == 'feather':
+        return pd.read_feather(path)
+    return pd.read_csv(path, sep='\t')
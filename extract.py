@@ -0,0 +1,189 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Extract page text from a pdf file, serial or split across worker processes
+    - each worker opens the pdf on its own and cleans a range of pages
+    - cleaned pages always come back in page order
+    - with a PageCache, pages seen before are not extracted again
+    - the text of a page comes from a pdf backend (pdf_backend.py), 'layout' by default
+    - pages are streamed: one page of parsed pdf objects at a time, a few chunks in flight with workers
+    - the pdf is a file name or its content as bytes (sent to each worker task)
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf_backend import get_backend
+from text_cache import file_hash, clean_fingerprint
+
+
+def page_count(pdf_file, backend='layout'):
+    b = get_backend(backend)
+    with b.open(pdf_file) as doc:
+        return b.page_count(doc)
+
+
+def iter_chunk(pdf_file, numbers, clean, args=(), backend='layout'):
+    """
+    input: pdf file, page numbers (from 1), clean function, backend name
+    output: generator of (raw page text, cleaned page text)
+    """
+    b = get_backend(backend)
+    with b.open(pdf_file) as doc:
+        for n in numbers:
+            text = b.page_text(doc, n)
+            yield text, clean(text, n, *args)
+
+
+def extract_chunk(pdf_file, numbers, clean, args=(), backend='layout'):
+    """
+    list of (raw page text, cleaned page text), one worker task
+    """
+    return list(iter_chunk(pdf_file, numbers, clean, args, backend))
+
+
+def extract_missing(pdf_file, numbers, clean, args, workers, chunk_size, backend='layout'):
+    """
+    generator of (page number, raw text, cleaned text) for the given pages, in order
+    """
+    if workers <= 1:
+        for n, (text, cleaned) in zip(numbers, iter_chunk(pdf_file, numbers, clean, args, backend)):
+            yield n, text, cleaned
+        return
+
+    chunks = iter([numbers[i:i + chunk_size] for i in range(0, len(numbers), chunk_size)])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # two chunks per worker in flight, finished chunks do not pile up in memory
+        running = deque()
+        for chunk in chunks:
+            running.append((chunk, pool.submit(extract_chunk, pdf_file, chunk, clean, args, backend)))
+            if len(running) == 2 * workers:
+                break
+        while running:
+            chunk, future = running.popleft()
+            next_chunk = next(chunks, None)
+            if next_chunk is not None:
+                running.append((next_chunk, pool.submit(extract_chunk, pdf_file, next_chunk, clean, args, backend)))
+            for n, (text, cleaned) in zip(chunk, future.result()):
+                yield n, text, cleaned
+
+
+def extract_pages(pdf_file, clean, args=(), workers=1, chunk_size=20, cache=None, backend='layout'):
+    """
+    input: pdf file, clean(text, page_number, *args) function
+           - workers: number of processes, 1 runs in this process
+           - chunk_size: number of pages per task
+           - cache: optional PageCache for raw and cleaned page text
+           - backend: pdf backend name, see pdf_backend.py
+    output: generator of cleaned page text, in page order
+    """
+    if cache is None:
+        n = page_count(pdf_file, backend)
+        for _, _, cleaned in extract_missing(pdf_file, list(range(1, n + 1)), clean, args, workers, chunk_size, backend):
+            yield cleaned
+        return
+
+    pdf_hash = file_hash(pdf_file)
+    # text of the other backends is cached under its own keys
+    raw_key = 'raw' if backend == 'layout' else 'raw-' + backend
+    clean_key = clean_fingerprint(clean, args) + ('' if backend == 'layout' else '-' + backend)
+
+    n = cache.get(pdf_hash, 'pages')
+    if n is None:
+        n = page_count(pdf_file, backend)
+        cache.put(str(n), pdf_hash, 'pages')
+    n = int(n)
+
+    # cleaned page, else clean the cached raw page, else extract
+    # cached pages are read when their turn comes, not all held in memory first
+    missing = [i for i in range(1, n + 1) if not cache.has(pdf_hash, i, clean_key) and not cache.has(pdf_hash, i, raw_key)]
+    extracted = extract_missing(pdf_file, missing, clean, args, workers, chunk_size, backend) if missing else iter(())
+    missing = set(missing)
+
+    for i in range(1, n + 1):
+        if i in missing:
+            _, raw, cleaned = next(extracted)
+        else:
+            raw = None
+            cleaned = cache.get(pdf_hash, i, clean_key)
+            if cleaned is None:
+                raw = cache.get(pdf_hash, i, raw_key)
+                if raw is None:
+                    # evicted since the check above
+                    raw, cleaned = extract_chunk(pdf_file, [i], clean, args, backend)[0]
+                else:
+                    cleaned = clean(raw, i, *args)
+                    cache.put(cleaned, pdf_hash, i, clean_key)
+                    raw = None
+        if raw is not None:
+            cache.put(raw, pdf_hash, i, raw_key)
+            cache.put(cleaned, pdf_hash, i, clean_key)
+        yield cleaned
+
+
+def rreplace(s, old, new, occurrence):
+   """
+   Reverse replace string
+   """
+   li = s.rsplit(old, occurrence)
+   return new.join(li)
+
+
+def clean_page(text, n, title, strip_chars, drop_from_end, first_page):
+    """
+    input: page text, page number, profile cleaning rules
+    output: cleaned page text
+            - remove title, page number
+            - remove the last occurrences of drop_from_end, e.g. '*'
+            - strip strip_chars, spaces at the beginning of each line
+    """
+    # output from first_page
+    if n < first_page:
+        return ''
+    new_text = rreplace(text, str(n), '', 1)
+    if title:
+        new_text = new_text.replace(title, '')
+    lines = []
+    for line in new_text.splitlines():
+        for old, occurrence in drop_from_end:
+            line = rreplace(line, old, '', occurrence)
+        for c in strip_chars:
+            line = line.replace(c, '').lstrip().rstrip()
+        lines.append(line + '\n')
+    return ''.join(lines)
+
+
+def pdf_to_text(pdf_file, txt_file, profile, workers=1, chunk_size=20, cache=None, backend=None):
+    """
+    input: pdf file, profile
+           - workers: number of processes extracting pages, 1 for serial
+           - chunk_size: number of pages per worker task
+           - cache: PageCache, skip the pdf backend for pages already extracted and cleaned
+           - backend: pdf backend name, default profile.pdf_backend
+    output: raw text, same output with any number of workers
+            returns the character offset where each page starts in the text
+    """
+    page_offsets = []
+    offset = 0
+    with open(txt_file, 'w+', encoding='utf-8') as f_out:
+        for text in extract_pages(pdf_file, clean_page, profile.clean_args(), workers, chunk_size, cache, backend or profile.pdf_backend):
+            page_offsets.append(offset)
+            offset += len(text)
+            f_out.write(text)
+    return page_offsets
+
+
+def pdf_text(pdf_file, profile, workers=1, chunk_size=20, cache=None, backend=None):
+    """
+    pdf_to_text without a text file
+    input: pdf file or its content (bytes), profile, see pdf_to_text
+    output: cleaned text, character offset where each page starts in the text
+    """
+    pages = list(extract_pages(pdf_file, clean_page, profile.clean_args(), workers, chunk_size, cache, backend or profile.pdf_backend))
+    page_offsets = []
+    offset = 0
+    for text in pages:
+        page_offsets.append(offset)
+        offset += len(text)
+    return ''.join(pages), page_offsets
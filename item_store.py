@@ -0,0 +1,209 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Parsed items in document order
+    - every item (sequence, question, condition, loop) keeps its character offset and page
+    - items are kept sorted by offset, in arrays
+    - sections and condition / loop blocks are intervals: the section and the blocks
+      containing an offset are found with a binary search
+    Blocks: IF opens a block, ELSEIF / ELSE close it and open the next branch,
+    ENDIF closes it, a loop is closed by its end line, a new section closes all open blocks.
+"""
+
+from array import array
+from bisect import bisect_right
+import pandas as pd
+
+from codelists import CodeLists, code_line
+
+
+class ItemStore:
+
+    def __init__(self, sequences, questions, conditions, text_length, page_offsets=None):
+        """
+        input: parse_text output (sequences, Question records, conditions and loops),
+               length of the text, start offset of each page
+        """
+        items = []
+        for text, offset in sequences:
+            items.append((offset, 'sequence', text))
+        last = 0
+        for record in questions:
+            # a question whose text was not found stays after the question before it
+            offset = record.offset if record.offset is not None else last
+            last = offset
+            items.append((offset, 'question', record))
+        for item_type, text, offset in conditions:
+            items.append((offset, item_type, text))
+        items.sort(key=lambda item: item[0])
+
+        self.offsets = array('q', [item[0] for item in items])
+        self.kinds = [item[1] for item in items]
+        self.records = [item[2] for item in items]
+        self.page_offsets = array('q', page_offsets or [])
+        self.text_length = text_length
+
+        self.section_starts = array('q')
+        self.section_items = array('q')
+        self.block_starts = array('q')
+        self.block_ends = array('q')
+        self.block_parents = array('q')
+        self.block_items = array('q')
+        self.block_kinds = []
+        # item -> its own block, -1 for items that are not blocks
+        self.item_blocks = array('q', [-1] * len(items))
+        self._build_blocks()
+
+    def _open(self, stack, i, kind):
+        b = len(self.block_starts)
+        self.block_starts.append(self.offsets[i])
+        self.block_ends.append(self.text_length)
+        self.block_parents.append(stack[-1] if stack else -1)
+        self.block_items.append(i)
+        self.block_kinds.append(kind)
+        self.item_blocks[i] = b
+        stack.append(b)
+
+    def _close(self, stack, kind, offset):
+        """
+        close blocks up to and including the innermost block of this kind
+        """
+        if kind not in (self.block_kinds[b] for b in stack):
+            return
+        while stack:
+            b = stack.pop()
+            self.block_ends[b] = offset
+            if self.block_kinds[b] == kind:
+                return
+
+    def _build_blocks(self):
+        stack = []
+        for i, kind in enumerate(self.kinds):
+            offset = self.offsets[i]
+            if kind == 'sequence':
+                while stack:
+                    self.block_ends[stack.pop()] = offset
+                self.section_starts.append(offset)
+                self.section_items.append(i)
+            elif kind == 'condition':
+                if self.records[i].split(' ')[0].upper() in ('ELSEIF', 'ELSE'):
+                    self._close(stack, 'condition', offset)
+                self._open(stack, i, 'condition')
+            elif kind == 'loop':
+                self._open(stack, i, 'loop')
+            elif kind == 'endif':
+                self._close(stack, 'condition', offset)
+            elif kind == 'endloop':
+                self._close(stack, 'loop', offset)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def page(self, offset):
+        """
+        page number of an offset, None without page offsets
+        """
+        if not self.page_offsets:
+            return None
+        return bisect_right(self.page_offsets, offset)
+
+    def section(self, offset):
+        """
+        item index of the section containing offset, -1 if none
+        """
+        s = bisect_right(self.section_starts, offset) - 1
+        return self.section_items[s] if s >= 0 else -1
+
+    def block(self, offset):
+        """
+        innermost condition / loop block containing offset, -1 if none
+        """
+        b = bisect_right(self.block_starts, offset) - 1
+        while b >= 0 and not offset < self.block_ends[b]:
+            b = self.block_parents[b]
+        return b
+
+    def enclosing_block(self, i):
+        """
+        innermost block containing item i, not counting the block item i opens
+        """
+        own = self.item_blocks[i]
+        if own >= 0:
+            return self.block_parents[own]
+        return self.block(self.offsets[i])
+
+    def blocks(self, i):
+        """
+        all blocks containing item i, innermost first
+        """
+        result = []
+        b = self.enclosing_block(i)
+        while b >= 0:
+            result.append(b)
+            b = self.block_parents[b]
+        return result
+
+    def item_rows(self, i, codelists=None, seen=None):
+        """
+        ESRC (item_type, content, codelist id) rows of item i
+        codelists, seen: compact rows, the code_list rows of a list only if its id is not in seen yet
+        """
+        kind = self.kinds[i]
+        record = self.records[i]
+        if kind == 'sequence':
+            return [('sequence', record, '')]
+        if kind == 'condition':
+            return [('condition (' + record.split(' ')[0].lower() + ')', record, '')]
+        if kind == 'loop':
+            return [('condition (loop)', record, '')]
+        if kind == 'question':
+            label, question, instruction, codes, response, offset = record
+            list_id = codelists.id(codes) if codelists is not None else ''
+            # an empty label ('? ' line) has no question_name row, as in get_esrc
+            rows = [('question_name', label, list_id)] if label else []
+            for item_type, content in [('question', question), ('instruction', instruction), ('response', response)]:
+                if content:
+                    rows.append((item_type, content, ''))
+            if codelists is not None:
+                if list_id in seen:
+                    return rows
+                seen.add(list_id)
+            for value, cat in codes:
+                rows.append(('code_list', code_line(value, cat), list_id))
+            return rows
+        return []
+
+    def to_esrc(self, compact=False):
+        """
+        ESRC dataframe in document order, with provenance:
+        offset, page, section and innermost condition / loop of every item
+        compact: codelist_id column, the code_list rows of each distinct list once
+        """
+        columns = {'item_type': [], 'content': [], 'offset': [], 'page': [], 'section': [], 'condition': []}
+        list_ids = []
+        codelists, seen = (CodeLists(), set()) if compact else (None, None)
+        for i in range(len(self)):
+            rows = self.item_rows(i, codelists, seen)
+            if not rows:
+                continue
+            offset = self.offsets[i]
+            page = self.page(offset)
+            s = self.section(offset)
+            section = self.records[s] if s >= 0 and s != i else ''
+            b = self.enclosing_block(i)
+            condition = self.records[self.block_items[b]] if b >= 0 else ''
+            for item_type, content, list_id in rows:
+                list_ids.append(list_id)
+                columns['item_type'].append(item_type)
+                columns['content'].append(content)
+                columns['offset'].append(offset)
+                columns['page'].append(page)
+                columns['section'].append(section)
+                columns['condition'].append(condition)
+        if compact:
+            columns['codelist_id'] = list_ids
+        df = pd.DataFrame(columns)
+        df['item_type'] = df['item_type'].astype('category')
+        df['page'] = df['page'].astype('Int64')
+        return df
@@ -0,0 +1,152 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    One pass over the cleaned text lines, typed tokens for all extractors
+    - token: (kind, text, character offset of the first line)
+    - line tokens: SEQUENCE, LABEL, CODE, RESPONSE, TEXT
+    - block tokens: IF, ELSEIF, ELSE, LOOP (continuation lines joined), ENDIF, ENDLOOP
+    A condition or loop block runs to the next blank line (or a condition_stop_prefix line),
+    at the end of the text an open block is closed.
+    Lines inside a block still give their SEQUENCE and LABEL tokens, as these are
+    found line by line; the other line tokens are only given outside blocks.
+"""
+
+SEQUENCE = 'SEQUENCE'
+LABEL = 'LABEL'
+CODE = 'CODE'
+RESPONSE = 'RESPONSE'
+TEXT = 'TEXT'
+IF = 'IF'
+ELSEIF = 'ELSEIF'
+ELSE = 'ELSE'
+ENDIF = 'ENDIF'
+LOOP = 'LOOP'
+ENDLOOP = 'ENDLOOP'
+
+condition_kinds = (IF, ELSEIF, ELSE)
+
+
+def sequence_or_label(line, profile):
+    """
+    (SEQUENCE, module and section name) or (LABEL, question label) of a line, None for other lines
+    """
+    p = profile
+    stripped = line.rstrip()
+    if stripped.startswith(p.sequence_prefixes):
+        return SEQUENCE, stripped
+    elif not (p.sequence_skip_prefix and line.startswith(p.sequence_skip_prefix)) and stripped.endswith(p.sequence_suffixes):
+        return SEQUENCE, stripped
+    elif p.sequence_pattern is not None and p.sequence_pattern.search(line) is not None:
+        return SEQUENCE, p.sequence_format % p.sequence_pattern.search(line).group(1)
+    elif p.label_marker is not None:
+        if line[0] == p.label_marker:
+            long_text = line.replace(p.label_marker, '').lstrip()
+            return LABEL, long_text.split(' ')[0].split('[')[0].split('*')[0].replace('\n', '')
+    elif len(stripped.split(' ')) == 1 and line[0].isupper() and stripped not in p.exclude and not stripped.endswith(p.label_bad_endings):
+        return LABEL, stripped.replace('*', '')
+    return None
+
+
+def line_kind(line, profile):
+    """
+    CODE, RESPONSE or TEXT for a line that is not a sequence or label, None for a blank line
+    """
+    p = profile
+    if line == '\n' or not line.strip():
+        return None
+    if p.code_line_pattern.match(line) is not None:
+        return CODE
+    if p.response_line_pattern is not None and p.response_line_pattern.match(line) is not None:
+        return RESPONSE
+    return TEXT
+
+
+def is_loop(line, profile, keyword_start=True):
+    """
+    keyword_start: False if no line start keyword of the profile matches, skips that test
+    """
+    p = profile
+    if keyword_start and p.loop_matcher.startswith(line) is not None:
+        return True
+    if not p.loop_keywords:
+        return False
+    lower = line.lower()
+    if p.loop_keyword_matcher.first(lower) == -1:
+        return False
+    return p.loop_keyword_matcher.any_group(lower, p.loop_keywords)
+
+
+def block_start(line, prev_line, profile, keyword_start=True):
+    """
+    IF / ELSEIF / ELSE / LOOP if a block starts at this line, else None
+    prev_line: the line before, or the joined text of the block before
+    """
+    p = profile
+    keyword = p.condition_matcher.startswith(line) if keyword_start else None
+    if keyword is not None and (prev_line == '\n' or not p.condition_after_blank) and len(line.split(' ')) > 1:
+        kind = keyword.upper()
+        return kind if kind in condition_kinds else IF
+    if is_loop(line, p, keyword_start):
+        return LOOP
+    return None
+
+
+def tokenize(lines, profile):
+    """
+    input: text lines (with their '\\n'), profile
+    output: generator of (kind, text, offset) tokens, in the order of the text
+    """
+    p = profile
+    offset = 0
+    prev_line = ''
+    # open block: kind, offset, lines so far, tokens of its lines
+    block = None
+    for line in lines:
+        start = offset
+        offset += len(line)
+        found = sequence_or_label(line, p)
+
+        if block is not None:
+            kind, block_offset, parts, inside = block
+            stop = line == '\n' or (kind != LOOP and p.condition_stop_prefix and line.startswith(p.condition_stop_prefix))
+            if not stop:
+                parts.append(line)
+                if found is not None:
+                    inside.append((found[0], found[1], start))
+                continue
+            # the line that ends a block is not the start of another one
+            text = ''.join(parts).replace('\n', ' ')
+            yield kind, text.rstrip(), block_offset
+            yield from inside
+            block = None
+            prev_line = text
+            if found is not None:
+                yield found[0], found[1], start
+            else:
+                kind = line_kind(line, p)
+                if kind is not None:
+                    yield kind, line.rstrip(), start
+            continue
+
+        keyword_start = p.line_start_matcher.startswith(line) is not None
+        kind = block_start(line, prev_line, p, keyword_start)
+        if kind is not None:
+            block = (kind, start, [line], [(found[0], found[1], start)] if found is not None else [])
+            continue
+        if found is not None:
+            yield found[0], found[1], start
+        if keyword_start and p.condition_end_matcher.startswith(line) is not None:
+            yield ENDIF, line.rstrip(), start
+        elif keyword_start and p.loop_end_matcher.startswith(line) is not None:
+            yield ENDLOOP, line.rstrip(), start
+        elif found is None:
+            kind = line_kind(line, p)
+            if kind is not None:
+                yield kind, line.rstrip(), start
+        prev_line = line
+
+    if block is not None:
+        kind, block_offset, parts, inside = block
+        yield kind, ''.join(parts).replace('\n', ' ').rstrip(), block_offset
+        yield from inside
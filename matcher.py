@@ -0,0 +1,76 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Compiled keyword matcher, one regex alternation for a whole keyword list
+    - first keyword in a text, in one scan instead of one str.find per keyword
+    - keyword at the start of a line
+    - all keywords in a text, to test keyword groups
+    - exact token lookups in a set
+"""
+
+import re
+
+
+class KeywordMatcher:
+    """
+    keywords are matched literally, the longest keyword wins at the same offset
+    """
+
+    def __init__(self, keywords):
+        self.keywords = frozenset(keywords)
+        keys = sorted(self.keywords, key=len, reverse=True)
+        if keys:
+            alternation = '|'.join(re.escape(key) for key in keys)
+            self.pattern = re.compile(alternation)
+            # lookahead finds overlapping occurrences too
+            self.all_pattern = re.compile('(?=(%s))' % alternation)
+        else:
+            self.pattern = None
+            self.all_pattern = None
+        # keyword -> all keywords it contains, e.g. 'repeat question' contains 'repeat'
+        self.contains = {key: frozenset(k for k in keys if k in key) for key in keys}
+
+    def __contains__(self, token):
+        """
+        exact token lookup
+        """
+        return token in self.keywords
+
+    def first(self, text):
+        """
+        offset of the first keyword in text, -1 if none
+        """
+        if self.pattern is None:
+            return -1
+        m = self.pattern.search(text)
+        return -1 if m is None else m.start()
+
+    def startswith(self, text):
+        """
+        keyword text starts with, None if none
+        """
+        if self.pattern is None:
+            return None
+        m = self.pattern.match(text)
+        return None if m is None else m.group()
+
+    def found(self, text):
+        """
+        set of keywords in text
+        """
+        if self.all_pattern is None:
+            return frozenset()
+        result = set()
+        for m in self.all_pattern.finditer(text):
+            result |= self.contains[m.group(1)]
+        return result
+
+    def any_group(self, text, groups):
+        """
+        True if all keywords of any group are in text
+        """
+        if not groups:
+            return False
+        found = self.found(text)
+        return any(found.issuperset(words) for words in groups)
@@ -0,0 +1,134 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Per stage metrics of one document
+    - wall and CPU time of each stage (CPU includes finished worker processes)
+    - peak resident memory (RSS) at the end of each stage, of this process and of finished worker processes
+    - counters: pages, bytes read, label pairs, regex calls, rows per item type, ...
+    - written as a JSON file per document, or appended as one line to a JSONL file
+    One stage can be run under cProfile or tracemalloc, see profile_stage.
+"""
+
+from contextlib import contextmanager
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+
+profilers = ('cprofile', 'tracemalloc')
+
+
+def cpu_time():
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def peak_rss():
+    """
+    (peak RSS of this process, largest peak RSS of its finished child processes) in bytes,
+    (None, None) where the resource module is missing (Windows)
+    """
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # ru_maxrss is in kilobytes, in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+class Metrics:
+
+    def __init__(self, document='', profile_stage=None, profiler='cprofile', profile_file=None):
+        """
+        document: name of the document, e.g. the pdf file
+        profile_stage: name of the stage to profile, None for no profiling
+        profiler: 'cprofile' (stats written to profile_file) or 'tracemalloc' (top allocations kept in the metrics)
+        """
+        if profiler not in profilers:
+            raise ValueError('profiler must be one of %s' % ', '.join(profilers))
+        self.document = document
+        self.profile_stage = profile_stage
+        self.profiler = profiler
+        self.profile_file = profile_file
+        self.stages = {}
+        self.counters = {}
+        self.profile = None
+
+    @contextmanager
+    def stage(self, name):
+        """
+        with metrics.stage('get_esrc'): ...
+        a stage entered more than once adds up
+        """
+        profiling = name == self.profile_stage
+        if profiling:
+            profiler = self._start_profiler()
+        wall, cpu = time.perf_counter(), cpu_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, cpu_time() - cpu
+            if profiling:
+                self._stop_profiler(name, profiler)
+            s = self.stages.setdefault(name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'calls': 0})
+            s['wall_seconds'] += wall
+            s['cpu_seconds'] += cpu
+            s['calls'] += 1
+            s['peak_rss_bytes'], s['children_peak_rss_bytes'] = peak_rss()
+
+    def _start_profiler(self):
+        if self.profiler == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+        tracemalloc.start()
+        return None
+
+    def _stop_profiler(self, name, profiler):
+        if self.profiler == 'cprofile':
+            profiler.disable()
+            if self.profile_file:
+                profiler.dump_stats(self.profile_file)
+            self.profile = {'stage': name, 'profiler': 'cprofile', 'file': self.profile_file}
+            return
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        top = [{'where': str(stat.traceback), 'bytes': stat.size, 'count': stat.count}
+               for stat in snapshot.statistics('lineno')[:20]]
+        self.profile = {'stage': name, 'profiler': 'tracemalloc', 'current_bytes': current, 'peak_bytes': peak, 'top': top}
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name, value):
+        self.counters[name] = value
+
+    def to_dict(self):
+        stages = {name: {k: round(v, 6) if isinstance(v, float) else v for k, v in s.items()}
+                  for name, s in self.stages.items()}
+        rss, children_rss = peak_rss()
+        result = {'document': self.document, 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                  'stages': stages, 'counters': dict(self.counters),
+                  'peak_rss_bytes': rss, 'children_peak_rss_bytes': children_rss}
+        if self.profile is not None:
+            result['profile'] = self.profile
+        return result
+
+    def write(self, path):
+        """
+        JSON file, path ending with .jsonl: append one line
+        """
+        if path.endswith('.jsonl'):
+            with open(path, 'a') as f:
+                f.write(json.dumps(self.to_dict()) + '\n')
+        else:
+            with open(path, 'w') as f:
+                json.dump(self.to_dict(), f, indent=1)
+        return path
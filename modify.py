@@ -1,6 +1,6 @@
 #!/bin/env python3
 
-"""  
+"""
     Modify the testing data to have same label as training data
     - 'condition (if)',  'condition (elseif)' become 'conditional'
     - 'code_list' become 'codelist'
@@ -8,37 +8,276 @@
     - no 'statement'
     - 'condition (loop)' become 'loop'
     - remove 'response'
-    - what about sequence?? the training data doesn't have it (RCNIC does have it though), will remove it 
+    - what about sequence?? the training data doesn't have it (RCNIC does have it though), will remove it
+    The ESRC files are read as Parquet or Feather when there is one as new as the TSV, else as TSV.
+    Files are modified in worker processes; a manifest in the output directory keeps the size, mtime
+    and hash of each ESRC file, a rerun only writes the files that changed.
+    With --dataset all items go to one dataset instead: shards of at most --shard-rows rows (or
+    --shard-bytes of text) with a document column, and an index.json with the row ranges of each document.
 """
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import argparse
+import json
+import os
+
+import numpy as np
 import pandas as pd
 
-outdir = '../2021_12_13'
-Path(outdir).mkdir(parents=True, exist_ok=True)
-
-# get 3 test files
-test_files = list(Path('../questionnaire/').glob('**/*_ESRC.csv'))
-
-for f in test_files:
-    df = pd.read_csv(f, sep='\t')
-    
-    # modify item type
-    df['new'] = df['item_type'].apply(lambda x: 'conditional' if x == 'condition (if)' else 
-                                                'codelist' if x == 'code_list' else
-                                                'loop' if x == 'condition (loop)' else
-                                                x)
-    # drop column                                            
-    df.drop('item_type', axis=1, inplace=True)
-    
-    # rename column
-    df.rename(columns={'new': 'item_type'}, inplace=True)
-    
-    # re-order columns
-    df = df[['item_type', 'content']]
-    
-    # remove response and sequence
-    df_sub = df[~df['item_type'].isin(['response', 'sequence'])]
-
-    df_sub.to_csv(Path(outdir, f.name), sep='\t')
+from esrc_io import columnar, extensions, read_esrc, write_esrc
+from text_cache import file_state, load_manifest, same_file, save_manifest
+
+
+# change it when the output changes, all files are written again
+modify_version = 1
+
+item_type_map = {
+    'condition (if)': 'conditional',
+    'code_list': 'codelist',
+    'condition (loop)': 'loop',
+}
+removed_item_types = ['response', 'sequence']
+
+
+def relabel(item_type):
+    """
+    input: item_type series
+    output: item_type with the training data labels, mapped once per category, not per row
+    """
+    item_type = item_type.astype('category')
+    categories = item_type.cat.categories
+    lookup = np.array([item_type_map.get(c, c) for c in categories] + [np.nan], dtype=object)
+    # code -1 (missing) takes the last entry
+    return pd.Series(lookup[item_type.cat.codes.to_numpy()], index=item_type.index, name=item_type.name)
+
+
+def modify(df):
+    """
+    ESRC dataframe -> (item_type, content) with the training labels, no response and sequence rows
+    """
+    df = pd.DataFrame({'item_type': relabel(df['item_type']), 'content': df['content']})
+    return df[~df['item_type'].isin(removed_item_types)]
+
+
+def find_esrc_files(root):
+    """
+    one ESRC file per questionnaire: the newest one, a columnar file (no text to parse) when it is
+    not older than the TSV; a columnar file left by an earlier run with --format is not read
+    output: {stem: file}
+    """
+    candidates = {}
+    patterns = ['**/*_ESRC.csv', '**/*_ESRC.feather', '**/*_ESRC.parquet']
+    for rank, pattern in enumerate(patterns):
+        for f in sorted(Path(root).glob(pattern)):
+            candidates.setdefault(f.with_suffix(''), []).append((f.stat().st_mtime_ns, rank, f))
+    return {stem: max(files)[2] for stem, files in candidates.items()}
+
+
+def document_id(esrc_file):
+    """
+    NCDS_Age_42_ESRC.csv -> NCDS_Age_42
+    """
+    stem = Path(esrc_file).stem
+    return stem[:-len('_ESRC')] if stem.endswith('_ESRC') else stem
+
+
+def modify_file(esrc_file, output_file):
+    df_sub = modify(read_esrc(str(esrc_file)))
+    df_sub.to_csv(output_file, sep='\t')
+    return output_file
+
+
+def is_current(entry, esrc_file, output_file):
+    """
+    written before from the same ESRC file, unchanged, and the output is still there
+    """
+    if entry is None or entry.get('source') != str(esrc_file) or entry.get('version') != modify_version:
+        return False
+    if not os.path.exists(output_file):
+        return False
+    return same_file(entry, esrc_file)
+
+
+def run_modify(root='../questionnaire/', outdir='../2021_12_13', workers=None, manifest_file=None, force=False):
+    """
+    input: directory of ESRC files, output directory
+           - manifest_file: default OUTDIR/modify_manifest.json
+           - force: write all files
+    output: list of the files written
+    """
+    Path(outdir).mkdir(parents=True, exist_ok=True)
+    manifest_file = manifest_file or os.path.join(outdir, 'modify_manifest.json')
+    manifest = load_manifest(manifest_file)
+
+    jobs = []
+    for stem, esrc_file in find_esrc_files(root).items():
+        output_file = os.path.join(outdir, stem.name + '.csv')
+        if force or not is_current(manifest.get(output_file), esrc_file, output_file):
+            jobs.append((esrc_file, output_file))
+    if not jobs:
+        return []
+
+    with ProcessPoolExecutor(max_workers=workers or min(len(jobs), os.cpu_count())) as pool:
+        written = list(pool.map(modify_file, *zip(*jobs)))
+
+    for esrc_file, output_file in jobs:
+        manifest[output_file] = dict(file_state(esrc_file), source=str(esrc_file), version=modify_version)
+    save_manifest(manifest, manifest_file)
+    return written
+
+
+class ShardWriter:
+    """
+    rows of many documents -> shards of the dataset, written as soon as they are full
+    """
+
+    def __init__(self, dataset_dir, shard_rows=1000000, shard_bytes=None, shard_format='parquet', row_group_rows=10000):
+        """
+        shard_rows: rows per shard, shard_bytes: also cut a shard at this many bytes of text (approximate)
+        row_group_rows: parquet row group size, a document is read by its row groups only
+        """
+        self.dataset_dir = dataset_dir
+        self.shard_rows = shard_rows
+        self.shard_bytes = shard_bytes
+        self.shard_format = shard_format
+        self.row_group_rows = row_group_rows
+        self.shards = []
+        self.documents = {}
+        self.buffer = []
+        self.rows = 0
+        self.bytes = 0
+
+    def add(self, document, df):
+        df = df.reset_index(drop=True)
+        df.insert(0, 'document', document)
+        sizes = df['content'].fillna('').astype(str).str.len().to_numpy() + len(document) + len(df.columns)
+        start = 0
+        while start < len(df):
+            # rows that still fit in the current shard
+            stop = min(len(df), start + self.shard_rows - self.rows)
+            if self.shard_bytes is not None:
+                fit = np.searchsorted(np.cumsum(sizes[start:stop]), self.shard_bytes - self.bytes, side='right')
+                stop = start + max(fit, 1 if self.rows == 0 else 0)
+            if stop > start:
+                part = df.iloc[start:stop]
+                self.documents.setdefault(document, []).append(
+                    {'shard': len(self.shards), 'start': self.rows, 'stop': self.rows + len(part)})
+                self.buffer.append(part)
+                self.rows += len(part)
+                self.bytes += int(sizes[start:stop].sum())
+            start = stop
+            if start < len(df):
+                self.flush()
+        if self.rows >= self.shard_rows or (self.shard_bytes is not None and self.bytes >= self.shard_bytes):
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        name = 'part-%05d%s' % (len(self.shards), extensions[self.shard_format])
+        df = pd.concat(self.buffer, ignore_index=True)
+        path = os.path.join(self.dataset_dir, name)
+        if self.shard_format == 'parquet':
+            columnar(df).to_parquet(path, index=False, row_group_size=self.row_group_rows)
+        else:
+            write_esrc(df, path, self.shard_format)
+        self.shards.append({'file': name, 'rows': self.rows, 'bytes': self.bytes})
+        self.buffer, self.rows, self.bytes = [], 0, 0
+
+    def close(self):
+        """
+        write the last shard and the index
+        """
+        self.flush()
+        index = {'version': modify_version, 'format': self.shard_format, 'row_group_rows': self.row_group_rows,
+                 'columns': ['document', 'item_type', 'content'], 'shards': self.shards, 'documents': self.documents}
+        save_manifest(index, os.path.join(self.dataset_dir, 'index.json'))
+        return index
+
+
+def load_modified(esrc_file):
+    return modify(read_esrc(str(esrc_file)))
+
+
+def write_dataset(root='../questionnaire/', dataset_dir='../2021_12_13_dataset', workers=None,
+                  shard_rows=1000000, shard_bytes=None, shard_format='parquet'):
+    """
+    input: directory of ESRC files, dataset directory
+    output: the index: shards and {document: [{'shard', 'start', 'stop'}]}
+    the documents are relabelled in worker processes and streamed to the shards in a stable order
+    """
+    Path(dataset_dir).mkdir(parents=True, exist_ok=True)
+    # shards of an earlier run
+    for f in Path(dataset_dir).glob('part-*'):
+        f.unlink()
+    esrc_files = iter(find_esrc_files(root).values())
+    workers = workers or os.cpu_count()
+    writer = ShardWriter(dataset_dir, shard_rows, shard_bytes, shard_format)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # two documents per worker in flight, relabelled documents do not pile up in memory
+        running = deque()
+        for esrc_file in esrc_files:
+            running.append((esrc_file, pool.submit(load_modified, esrc_file)))
+            if len(running) == 2 * workers:
+                break
+        while running:
+            esrc_file, future = running.popleft()
+            next_file = next(esrc_files, None)
+            if next_file is not None:
+                running.append((next_file, pool.submit(load_modified, next_file)))
+            writer.add(document_id(esrc_file), future.result())
+    return writer.close()
+
+
+def load_index(dataset_dir):
+    with open(os.path.join(dataset_dir, 'index.json')) as f:
+        return json.load(f)
+
+
+def read_document(dataset_dir, document, index=None):
+    """
+    rows of one document, only the parquet row groups that hold them are read
+    """
+    index = index or load_index(dataset_dir)
+    parts = []
+    for r in index['documents'][document]:
+        path = os.path.join(dataset_dir, index['shards'][r['shard']]['file'])
+        start, stop = r['start'], r['stop']
+        if index['format'] == 'parquet':
+            import pyarrow.parquet as pq
+            size = index['row_group_rows']
+            first = start // size
+            df = pq.ParquetFile(path).read_row_groups(range(first, (stop - 1) // size + 1)).to_pandas()
+            start, stop = start - first * size, stop - first * size
+        else:
+            df = read_esrc(path)
+        parts.append(df.iloc[start:stop])
+    return pd.concat(parts, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Relabel the ESRC files like the training data')
+    parser.add_argument('root', nargs='?', default='../questionnaire/')
+    parser.add_argument('--outdir', default='../2021_12_13')
+    parser.add_argument('--workers', type=int, help='default: number of CPUs')
+    parser.add_argument('--manifest', help='default: OUTDIR/modify_manifest.json')
+    parser.add_argument('--force', action='store_true', help='write all files, changed or not')
+    parser.add_argument('--dataset', metavar='DIR', help='write one sharded dataset to DIR instead of a file per questionnaire')
+    parser.add_argument('--shard-rows', type=int, default=1000000)
+    parser.add_argument('--shard-bytes', type=int, help='also cut shards at this many bytes of text')
+    parser.add_argument('--shard-format', choices=sorted(extensions), default='parquet')
+    args = parser.parse_args()
+
+    if args.dataset:
+        index = write_dataset(args.root, args.dataset, args.workers, args.shard_rows, args.shard_bytes, args.shard_format)
+        print('%d documents, %d shards in %s' % (len(index['documents']), len(index['shards']), args.dataset))
+        return
+
+    for output_file in run_modify(args.root, args.outdir, args.workers, args.manifest, args.force):
+        print(output_file)
+
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Local store of parsed question spans
+    - key: profile version, parser version, sha256 of the span text
+    - value: question text, instruction, code list, response
+    A revised questionnaire only re-parses the spans whose text changed.
+    New results are kept in memory and written in short transactions of at most batch_size rows
+    (commit, or when the batch is full): batch workers share the store file and the write lock.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+
+from text_cache import default_cache_dir
+
+
+class ParseStore:
+
+    # new results written per transaction at most
+    batch_size = 1000
+
+    def __init__(self, path=os.path.join(default_cache_dir, 'parse_store.sqlite'), parser_version=''):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.parser_version = parser_version
+        self.db = sqlite3.connect(path, timeout=60)
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS span (key TEXT PRIMARY KEY, value TEXT)')
+        # key -> value of the results not written yet
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, profile, span):
+        h = hashlib.sha256(span.encode('utf-8')).hexdigest()
+        return '%s:%s:%s' % (profile.version, self.parser_version, h)
+
+    def get(self, profile, span):
+        """
+        (question, instruction, codes, response) for this span text, None if not parsed before
+        """
+        key = self._key(profile, span)
+        value = self.pending.get(key)
+        if value is None:
+            row = self.db.execute('SELECT value FROM span WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value = row[0]
+        self.hits += 1
+        question, instruction, codes, response = json.loads(value)
+        return question, instruction, [tuple(code) for code in codes], response
+
+    def put(self, profile, span, parsed):
+        self.pending[self._key(profile, span)] = json.dumps(parsed)
+        if len(self.pending) >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        """
+        write the pending results in one transaction, the write lock is held only for it
+        """
+        if not self.pending:
+            return
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO span VALUES (?, ?)', self.pending.items())
+        self.pending = {}
+
+    def close(self):
+        self.commit()
+        self.db.close()
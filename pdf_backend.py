@@ -0,0 +1,121 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Pdf text backends, chosen by name (profile.pdf_backend)
+    - layout:   pdfplumber extract_text, word and line layout analysis (slowest, the original output)
+    - simple:   pdfplumber extract_text_simple, characters clustered into lines, no layout analysis
+    - pdfminer: pdfminer.six text converter, no box ordering, no vertical text detection
+    Each backend opens a pdf, a file or its content as bytes, counts its pages and returns the raw text of one page.
+    The objects parsed for a page are released after its text is extracted,
+    so memory stays flat however many pages the document has.
+"""
+
+from io import BytesIO, StringIO
+
+
+def pdf_stream(pdf_file):
+    """
+    pdf file name, or the pdf content (bytes) as a stream
+    """
+    return BytesIO(pdf_file) if isinstance(pdf_file, bytes) else pdf_file
+
+
+class LayoutBackend:
+    name = 'layout'
+
+    def open(self, pdf_file):
+        import pdfplumber
+        return pdfplumber.open(pdf_stream(pdf_file))
+
+    def page_count(self, doc):
+        return len(doc.pages)
+
+    def page_text(self, doc, n):
+        """
+        raw text of page n, from 1
+        """
+        page = doc.pages[n - 1]
+        text = self.extract(page)
+        release(page)
+        return text
+
+    def extract(self, page):
+        return page.extract_text()
+
+
+class SimpleBackend(LayoutBackend):
+    name = 'simple'
+
+    def extract(self, page):
+        return page.extract_text_simple()
+
+
+def release(page):
+    """
+    drop the chars, objects and layout pdfplumber keeps for a page
+    """
+    close = getattr(page, 'close', None) or page.flush_cache
+    close()
+
+
+class MinerDocument:
+    """
+    pdfminer pages of one open pdf file, one interpreter writing to a buffer
+    """
+
+    def __init__(self, pdf_file, laparams):
+        from pdfminer.converter import TextConverter
+        from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+        from pdfminer.pdfpage import PDFPage
+
+        self.f = BytesIO(pdf_file) if isinstance(pdf_file, bytes) else open(pdf_file, 'rb')
+        self.pages = list(PDFPage.get_pages(self.f))
+        self.out = StringIO()
+        manager = PDFResourceManager()
+        self.device = TextConverter(manager, self.out, laparams=laparams)
+        self.interpreter = PDFPageInterpreter(manager, self.device)
+
+    def page_text(self, n):
+        self.out.seek(0)
+        self.out.truncate()
+        self.interpreter.process_page(self.pages[n - 1])
+        # pdfminer ends a page with a form feed
+        return self.out.getvalue().rstrip('\x0c').rstrip('\n')
+
+    def close(self):
+        self.device.close()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class MinerBackend:
+    name = 'pdfminer'
+
+    def laparams(self):
+        from pdfminer.layout import LAParams
+        # boxes_flow=None: text boxes in reading order of their position, no layout ordering
+        return LAParams(boxes_flow=None, detect_vertical=False, all_texts=False)
+
+    def open(self, pdf_file):
+        return MinerDocument(pdf_file, self.laparams())
+
+    def page_count(self, doc):
+        return len(doc.pages)
+
+    def page_text(self, doc, n):
+        return doc.page_text(n)
+
+
+backends = {b.name: b for b in [LayoutBackend(), SimpleBackend(), MinerBackend()]}
+
+
+def get_backend(name):
+    if name not in backends:
+        raise ValueError('unknown pdf backend %s, one of %s' % (name, ', '.join(sorted(backends))))
+    return backends[name]
@@ -0,0 +1,63 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Producer / consumer pipeline over documents
+    - a producer thread runs the first stage (pdf extraction) of the next documents
+    - the caller consumes the results in the order of the jobs and runs the other stages
+    - the queue between them is bounded: the producer waits when `depth` documents are ready
+      and not consumed yet, so at most depth + 1 documents are extracted ahead
+    The extraction runs its pages in worker processes, the producer thread mostly waits for
+    them, so it overlaps with the parsing in the consumer thread.
+"""
+
+import queue
+import threading
+
+
+def pipeline(jobs, produce, depth=1):
+    """
+    input: jobs, produce(job) run in the producer thread, depth: bounded queue size
+    output: generator of (job, result of produce(job)), in the order of jobs
+            an exception raised by produce is raised here, at its job
+    """
+    ready = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # wait for room, give up when the consumer has stopped
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producer():
+        for job in jobs:
+            if stop.is_set():
+                return
+            try:
+                item = (job, produce(job), None)
+            except BaseException as e:
+                item = (job, None, e)
+            if not put(item):
+                return
+        put(done)
+
+    thread = threading.Thread(target=producer, name='pipeline-producer', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = ready.get()
+            if item is done:
+                break
+            job, result, error = item
+            if error is not None:
+                raise error
+            yield job, result
+    finally:
+        stop.set()
+        thread.join()
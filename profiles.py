@@ -0,0 +1,172 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Survey profiles: everything that differs between questionnaires
+    - pdf backend, page cleaning, sequence markers, question label rules, exclude lists
+    - condition / loop markers
+    - code, response and instruction patterns, terminators
+    Regexes and keyword sets are compiled once, when this module is loaded.
+"""
+
+import hashlib
+import re
+
+from matcher import KeywordMatcher
+from pdf_backend import get_backend
+
+
+def line_pattern(pattern):
+    """
+    pattern for the start of one line, from a pattern that starts with a newline
+    """
+    return re.compile(pattern[2:] if pattern.startswith(r'\n') else pattern)
+
+
+class Profile:
+    """
+    declarative description of one questionnaire layout, see the profiles below
+    """
+
+    def __init__(self, name,
+                 # pdf to text
+                 pdf_backend='layout', title='', strip_chars=('|',), drop_from_end=(), first_page=3,
+                 # sequences and question labels
+                 sequence_prefixes=(), sequence_suffixes=(), sequence_skip_prefix=None,
+                 sequence_pattern=None, sequence_format='%s',
+                 label_marker=None, exclude=(), label_bad_endings=(),
+                 # conditions and loops
+                 conditions=('IF', 'ELSEIF', 'ELSE'), condition_after_blank=False, condition_stop_prefix=None,
+                 loop_prefixes=(), loop_keywords=(),
+                 condition_end=('ENDIF',), loop_end=('ENDLOOP', 'END LOOP'),
+                 # label pairs
+                 label_lead='', label_open=r'\s*', label_close='', label_aliases=None,
+                 # question body
+                 code_pattern=r'\n(\d+) (.*)', code_split='\n', strip_code_quotes=False,
+                 response_pattern=r'\n(Text.*|Range.*)', response_inline=False,
+                 terminators=(), cut_at_terminator=False,
+                 instruction_patterns=(), instruction_reset=False, instruction_ellipsis=False,
+                 question_join=' ', question_cut=None, question_strip_chars=''):
+        # the rules as declared, any change gives a new version
+        rules = dict(locals())
+        del rules['self']
+        self.version = hashlib.sha256(repr(sorted(rules.items())).encode()).hexdigest()[:16]
+        self.name = name
+
+        get_backend(pdf_backend)
+        self.pdf_backend = pdf_backend
+        self.title = title
+        self.strip_chars = tuple(strip_chars)
+        self.drop_from_end = tuple(drop_from_end)
+        self.first_page = first_page
+
+        self.sequence_prefixes = tuple(sequence_prefixes)
+        self.sequence_suffixes = tuple(sequence_suffixes)
+        self.sequence_skip_prefix = sequence_skip_prefix
+        self.sequence_pattern = re.compile(sequence_pattern) if sequence_pattern else None
+        self.sequence_format = sequence_format
+        self.label_marker = label_marker
+        self.exclude = frozenset(exclude)
+        self.label_bad_endings = tuple(label_bad_endings)
+
+        self.conditions = tuple(conditions)
+        self.condition_after_blank = condition_after_blank
+        self.condition_stop_prefix = condition_stop_prefix
+        self.loop_prefixes = tuple(loop_prefixes)
+        self.loop_keywords = tuple(tuple(words) for words in loop_keywords)
+        self.condition_matcher = KeywordMatcher(self.conditions)
+        self.loop_matcher = KeywordMatcher(self.loop_prefixes)
+        self.loop_keyword_matcher = KeywordMatcher(word for words in self.loop_keywords for word in words)
+        # only used to close condition and loop blocks, see item_store.py
+        self.condition_end_matcher = KeywordMatcher(condition_end)
+        self.loop_end_matcher = KeywordMatcher(loop_end)
+        # any of the keywords above at the start of a line, one test for most lines
+        self.line_start_matcher = KeywordMatcher(self.conditions + self.loop_prefixes + tuple(condition_end) + tuple(loop_end))
+
+        self.label_lead = label_lead
+        self.label_open = label_open
+        self.label_close = label_close
+        self.label_aliases = dict(label_aliases or {})
+
+        self.code_pattern = re.compile(code_pattern)
+        self.code_split = code_split
+        self.strip_code_quotes = strip_code_quotes
+        self.response_pattern = re.compile(response_pattern)
+        self.response_inline = response_inline
+        # CODE and RESPONSE lines of the lexer, an inline response is part of the label line
+        self.code_line_pattern = line_pattern(code_pattern)
+        self.response_line_pattern = None if response_inline else line_pattern(response_pattern)
+        self.terminators = tuple(terminators)
+        self.terminator_matcher = KeywordMatcher(self.terminators)
+        self.cut_at_terminator = cut_at_terminator
+        self.instruction_patterns = tuple(re.compile(p) for p in instruction_patterns)
+        self.instruction_reset = instruction_reset
+        self.instruction_ellipsis = instruction_ellipsis
+        self.question_join = question_join
+        self.question_cut = question_cut
+        self.question_strip_chars = question_strip_chars
+
+    def clean_args(self):
+        """
+        arguments of engine.clean_page, also part of the page cache key
+        """
+        return (self.title, self.strip_chars, self.drop_from_end, self.first_page)
+
+    def __repr__(self):
+        return 'Profile(%r)' % self.name
+
+
+exclude = ['IF', 'ELSE', 'ENDIF', 'DATE', 'TIME', 'RESPONSE',
+           'OUT...', 'ONLY', "TESSA's?", 'RF', 'Allowance', 'STRING[40]', 'TESSA’s?', 'RF)' , 'Bonds?',
+           'EMPTY', 'INCAPACITATED', 'HERE', 'INTERVIEW.', 'LABEL?', 'Range:0..999997',
+           'CORRECT.', 'DIFFERENT', 'INTERVIEW?']
+
+
+NCDS = Profile(
+    'ncds',
+    strip_chars=('|', ':'),
+    sequence_prefixes=('Section',),
+    label_marker='?',
+    condition_stop_prefix='(',
+    loop_prefixes=('FOR Loop',),
+    label_aliases={'Hospital': 'Hospital  YES/NO'},
+    code_pattern=r'\n\((\d+)\) (.*)', code_split='\n(', strip_code_quotes=True,
+    response_pattern=r'(YES/NO|AGE|TEXT.*|ARRAY.*|TIMETYPE|DATETYPE|\d+\.\.\d+)', response_inline=True,
+    terminators=['\nIF', '\nELSEIF', '\nELSE', '\nENDIF', '\nLOOP FOR', '\nEND FILTER'], cut_at_terminator=True,
+    instruction_patterns=[r'(\[Loop:.*\n*.*)]', r'(Attributes.*)'],
+    question_cut='?', question_strip_chars='*',
+)
+
+
+ELSA_WAVE_1 = Profile(
+    'elsa_wave1',
+    title='ELSA Wave 1  Questionnaire  -  May 2002', drop_from_end=[('*', 10)],
+    sequence_suffixes=('Module', 'Section'), sequence_skip_prefix='Time at',
+    sequence_pattern='Time at start of (.*) section', sequence_format='%s section',
+    exclude=exclude,
+    condition_after_blank=True,
+    loop_keywords=[('repeat question',), ('repeat', 'for')],
+    label_lead='\n', label_open=r'\s*\n', label_close=r'\s*\n',
+    code_pattern=r'\n(\d+)   (.*)',
+    terminators=['Text', 'Range', 'Brackets', '\nIF', '\nELSEIF', '\nELSE', '\nENDIF', '\nREPEAT', '\nRepeat'],
+    instruction_reset=True, instruction_ellipsis=True,
+    question_join='',
+)
+
+
+ELSA_WAVE_2 = Profile(
+    'elsa_wave2',
+    title='ELSA Nurse Schedule', drop_from_end=[('*', 10)],
+    sequence_suffixes=('Module', 'Section'), sequence_skip_prefix='Time at',
+    sequence_pattern='Time at start of (.*) section', sequence_format='%s section',
+    exclude=exclude + ['[Loop', 'LOOP', 'GP?', 'K>', 'Ms).'], label_bad_endings=(']', '.'),
+    condition_after_blank=True,
+    loop_prefixes=('LOOP FOR',),
+    label_lead='\n', label_open=r'\s*\n', label_close=r'\s*\n',
+    code_pattern=r'\n(\d+) (.*)',
+    terminators=['Text', 'Range', 'Brackets', '\nIF', '\nELSEIF', '\nELSE', '\nENDIF', '\nLOOP FOR', '\nEND FILTER'],
+    instruction_patterns=[r'(\[Loop:.*\n*.*)]'],
+)
+
+
+profiles = {p.name: p for p in [NCDS, ELSA_WAVE_1, ELSA_WAVE_2]}
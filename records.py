@@ -0,0 +1,114 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Record types of the parsed items, emitted by the parser and kept until the ESRC export
+    - Sequence: module / section name
+    - Question: label, question text, instruction, code list, response
+    - CodeItem: one code of a code list, shared by all questions with that list (codelists.py)
+    - Condition: IF / ELSEIF / ELSE block or ENDIF line
+    - Loop: loop block or end of loop line
+    Slots only, no per record dict. A record unpacks like the tuple it replaces,
+    e.g. `label, question, instruction, codes, response, offset = record`.
+    CodeItem is a (value, category) tuple with names: a code list of them is equal to,
+    and hashes like, the tuple of (value, category) pairs, so it is its own interning key.
+"""
+
+from lexer import ENDIF
+
+
+class Sequence:
+    __slots__ = ('text', 'offset')
+
+    def __init__(self, text, offset):
+        self.text = text
+        self.offset = offset
+
+    def __iter__(self):
+        return iter((self.text, self.offset))
+
+    def __repr__(self):
+        return 'Sequence(%r, %r)' % (self.text, self.offset)
+
+
+class CodeItem(tuple):
+    __slots__ = ()
+
+    def __new__(cls, value, category):
+        return tuple.__new__(cls, (value, category))
+
+    @property
+    def value(self):
+        return self[0]
+
+    @property
+    def category(self):
+        return self[1]
+
+    def __repr__(self):
+        return 'CodeItem(%r, %r)' % self
+
+
+class Question:
+    __slots__ = ('label', 'question', 'instruction', 'codes', 'response', 'offset')
+
+    def __init__(self, label, question, instruction, codes, response, offset):
+        """
+        codes: tuple of CodeItem, offset: character offset of the label, None if the question text was not found
+        """
+        self.label = label
+        self.question = question
+        self.instruction = instruction
+        self.codes = codes
+        self.response = response
+        self.offset = offset
+
+    def __iter__(self):
+        return iter((self.label, self.question, self.instruction, self.codes, self.response, self.offset))
+
+    def __repr__(self):
+        return 'Question(%r, %r, %r, %r, %r, %r)' % tuple(self)
+
+
+class Condition:
+    __slots__ = ('kind', 'text', 'offset')
+
+    def __init__(self, kind, text, offset):
+        """
+        kind: lexer IF, ELSEIF, ELSE or ENDIF
+        """
+        self.kind = kind
+        self.text = text
+        self.offset = offset
+
+    @property
+    def item_type(self):
+        return 'endif' if self.kind == ENDIF else 'condition'
+
+    def __iter__(self):
+        return iter((self.item_type, self.text, self.offset))
+
+    def __repr__(self):
+        return 'Condition(%r, %r, %r)' % (self.kind, self.text, self.offset)
+
+
+class Loop:
+    __slots__ = ('text', 'offset', 'end')
+
+    def __init__(self, text, offset, end=False):
+        """
+        end: the end of loop line
+        """
+        self.text = text
+        self.offset = offset
+        self.end = end
+
+    @property
+    def item_type(self):
+        return 'endloop' if self.end else 'loop'
+
+    def __iter__(self):
+        return iter((self.item_type, self.text, self.offset))
+
+    def __repr__(self):
+        return 'Loop(%r, %r, %r)' % (self.text, self.offset, self.end)
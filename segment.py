@@ -0,0 +1,339 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Segment the cleaned text of a questionnaire into records, no pandas
+    - one pass of the lexer (lexer.py) for the sequences, labels, conditions and loops
+    - the question text, instruction, code list and response between each two labels
+    - the records can be written to a JSONL file and read back, see write_segments
+    The ESRC table of the records is made by engine.py or item_store.py.
+"""
+
+import json
+import os
+
+from codelists import CodeLists
+from lexer import tokenize, condition_kinds, SEQUENCE, LABEL, LOOP, ENDIF, ENDLOOP
+from metrics import Metrics
+from records import Sequence, Question, Condition, Loop
+from span_index import SpanIndex
+from text_store import text_lines
+
+
+# change when the question span parsing below changes, old parse results are not used
+parser_version = '2'
+
+
+def get_sequence(lines, profile):
+    """
+    input: text lines, profile
+    output: generator of (item type, text, character offset of the line)
+            - ('sequence', module and section name, offset)
+            - ('question_label', question label, offset)
+    """
+    return sequence_items(tokenize(lines, profile))
+
+
+def sequence_items(tokens):
+    for kind, text, offset in tokens:
+        if kind == SEQUENCE:
+            yield 'sequence', text, offset
+        elif kind == LABEL:
+            yield 'question_label', text, offset
+
+
+def get_condition(lines, profile):
+    """
+    input: text lines, profile
+    output: generator of (item type, text, character offset of the first line)
+            - ('condition', IF/ELSEIF/ELSE text, offset)
+            - ('loop', loop text, offset)
+            - ('endif', ENDIF line, offset), ('endloop', end of loop line, offset)
+            as Condition and Loop records, they unpack to these tuples
+    """
+    return condition_items(tokenize(lines, profile))
+
+
+def condition_items(tokens):
+    for kind, text, offset in tokens:
+        if kind in condition_kinds or kind == ENDIF:
+            yield Condition(kind, text, offset)
+        elif kind == LOOP:
+            yield Loop(text, offset)
+        elif kind == ENDLOOP:
+            yield Loop(text, offset, end=True)
+
+
+def get_question_code_from_questionpair(index, question_1, question_2, profile, debug=False, store=None, metrics=None):
+    """
+    find code list between two question lables
+    store: ParseStore, spans parsed before are not parsed again
+    metrics: optional Metrics, counts regex calls
+    """
+    result = index.between(question_1, question_2)
+    # print(result)
+    if result is None:
+        return '', '', [], []
+
+    if store is not None and not debug:
+        parsed = store.get(profile, result)
+        if parsed is None:
+            parsed = parse_question_span(result, profile, metrics=metrics)
+            store.put(profile, result, parsed)
+        return parsed
+    return parse_question_span(result, profile, debug, metrics)
+
+
+def parse_question_span(result, profile, debug=False, metrics=None):
+    """
+    input: text between two question labels, profile
+    output: question text, instruction, code list, response
+    """
+    p = profile
+    # code list, response and terminator scans
+    regex_calls = 3
+    if debug:
+        print("--------------------"*2)
+        print(result)
+        print("--------------------"*2)
+    codes = p.code_pattern.findall(result)
+
+    if p.response_inline:
+        response = p.response_pattern.findall(result.split('\n')[0])
+    else:
+        response = p.response_pattern.findall(result)
+
+    # question
+    # first occurence, one scan for all terminators
+    min_i = p.terminator_matcher.first(result)
+    if min_i != -1:
+        match = result[min_i:].split(' ')[0]
+    else:
+        match = ''
+
+    if p.cut_at_terminator and match != '':
+        result = result.split(match)[0]
+
+    if response != [] and p.response_inline:
+        question = result.replace(response[0], '').strip()
+    elif response != []:
+        question = result.split('\n' + response[0])[0]
+    elif codes != []:
+        question = result.split(p.code_split + codes[0][0])[0]
+    elif not p.cut_at_terminator and match != '':
+        question = result.split(match)[0]
+    else:
+        question = result.replace('\n', ' ')
+
+    # question literal / instruction
+    instruction = ''
+    for pattern in p.instruction_patterns:
+        regex_calls += 1
+        found = pattern.findall(question)
+        if len(found) > 0:
+            instruction = found[0]
+            question = instruction.replace(instruction, '')
+            break
+    else:
+        lines = question.split('\n')
+
+        allLine = ''
+        for index, line in enumerate(lines):
+            if line.isupper() and len(line.split(' ')) > 1 and index <= len(lines) - 2:
+                nextLine = lines[index+1]
+                allLine = (line + '\n' + nextLine)
+                line = nextLine
+
+                instruction = allLine.replace('\n', '')
+                question = question.replace(allLine, '')
+            elif line.isupper() and len(line.split(' ')) > 1 and index == len(lines) - 1:
+                instruction = line
+                question = ''
+            elif p.instruction_reset:
+                instruction = ''
+
+    if p.instruction_ellipsis and instruction == '':
+        if len(question.split('...')) > 1:
+            instruction = question.split('...')[1]
+            question = instruction.replace(instruction, '')
+
+    # the scripts wrote the instruction to a tab separated file and read it back with read_csv:
+    # only its first line was kept ('[Loop: x]' of '[Loop: x]\n[Loop: x', '' of '\nText'),
+    # the other lines became rows of no question
+    instruction = instruction.split('\n')[0]
+
+    question_text = question.replace('\n', p.question_join)
+    for c in p.question_strip_chars:
+        question_text = question_text.replace(c, '')
+    if p.question_cut is not None:
+        question_text = question_text.split(p.question_cut)[0].lstrip()
+
+    if metrics is not None:
+        metrics.count('regex_calls', regex_calls)
+    return question_text, instruction, codes, response
+
+
+def generate_code_list(content, L, profile, store=None, metrics=None, codelists=None):
+    """
+    input: text, question labels in order, profile
+           - store: optional ParseStore
+           - metrics: optional Metrics, counts label pairs, spans found and regex calls
+           - codelists: optional CodeLists, questions with the same code list share one tuple
+    output: generator of Question records (label, question, instruction, codes, response, offset)
+            codes: tuple of CodeItem, offset: character offset of the label, None if the question text was not found
+    """
+    codelists = codelists if codelists is not None else CodeLists()
+    p = profile
+    g = get_question_code_from_questionpair
+
+    # one scan for all labels
+    labels = list(L) + list(p.label_aliases.values())
+    index = SpanIndex(content, labels, lead=p.label_lead, open=p.label_open, close=p.label_close)
+
+    for i in range(0, len(L)-1):
+        # print("{}: {}..{}".format(i, L[i], L[i+1]))
+        question_1 = p.label_aliases.get(L[i], L[i])
+
+        # the span always ends at the next label: the scripts tested `second in L` for the label
+        # without its '_1' ending on a pandas Series, which looks in the index, never true
+        question, instruction, code_list, response = g(index, question_1, L[i+1], p, store=store, metrics=metrics)
+
+        codes = []
+        for value, cat in code_list:
+            if p.strip_code_quotes:
+                value = value.replace('"', '').replace("'", "").rstrip().lstrip()
+                cat = cat.replace('"', '').replace("'", "").rstrip().lstrip()
+            codes.append((int(value), cat))
+        codes = codelists.intern(codes)
+
+        yield Question(L[i], question, instruction, codes, response[0] if len(response) > 0 else '', index.last_start)
+
+    if metrics is not None:
+        metrics.count('label_pairs', max(len(L) - 1, 0))
+        metrics.count('spans_found', index.found)
+        # label scan, then one match per label occurrence checked
+        metrics.count('regex_calls', 1 + index.checks)
+
+
+def parse_text(content, profile, store=None, metrics=None):
+    """
+    input: cleaned text (str or TextStore), profile, optional ParseStore, optional Metrics
+    output: sequences (text, offset), question labels, question records, conditions and loops
+    """
+    metrics = metrics or Metrics()
+    # one pass over the text for sequences, labels, conditions and loops
+    with metrics.stage('tokenize'):
+        tokens = list(tokenize(text_lines(content), profile))
+    metrics.set('tokens', len(tokens))
+
+    with metrics.stage('get_sequence'):
+        sequences = [Sequence(text, offset) for kind, text, offset in tokens if kind == SEQUENCE]
+        labels = [text for kind, text, offset in tokens if kind == LABEL]
+    metrics.set('sequences', len(sequences))
+    metrics.set('labels', len(labels))
+
+    hits, misses = (store.hits, store.misses) if store is not None else (0, 0)
+    codelists = CodeLists()
+    with metrics.stage('generate_code_list'):
+        questions = list(generate_code_list(content, labels, profile, store, metrics, codelists))
+        if store is not None:
+            store.commit()
+    metrics.set('codelists', len(codelists))
+    if store is not None:
+        metrics.count('store_hits', store.hits - hits)
+        metrics.count('store_misses', store.misses - misses)
+
+    with metrics.stage('get_condition'):
+        conditions = list(condition_items(tokens))
+    for item_type in ['condition', 'loop']:
+        metrics.set(item_type + 's', sum(1 for c in conditions if c.item_type == item_type))
+    return sequences, labels, questions, conditions
+
+
+def write_debug_files(output_dir, sequences, labels, questions, conditions):
+    """
+    debug only: write the intermediate files
+    sequence, question_label, question, instruction, codelist, response, condition, loop
+    """
+    p = lambda name: os.path.join(output_dir, name)
+    with open(p('sequence.csv'), 'w+') as out_sequences, open(p('question_label.csv'), 'w+') as out_question_label:
+        out_sequences.write('Label\n')
+        out_question_label.write('Label\n')
+        for sequence, offset in sequences:
+            out_sequences.write('%s\n' %(sequence))
+        for label in labels:
+            out_question_label.write('%s\n' %(label))
+
+    with open(p('question.csv'), 'w+') as out_question, open(p('instruction.csv'), 'w+') as out_instruction, open(p('codelist.csv'), 'w+') as out_code, open(p('response.csv'), 'w+') as out_response:
+        out_question.write('questionLabel\tLiteral\n')
+        out_instruction.write('questionLabel\tInstruction\n')
+        out_code.write('questionLabel\tValue\tCategory\tcodes_order\n')
+        out_response.write('questionLabel\tResponse\n')
+        for label, question, instruction, codes, response, offset in questions:
+            out_question.write('%s\t%s\n' %(label, question))
+            out_instruction.write('%s\t%s\n' %(label, instruction))
+            for j, (value, cat) in enumerate(codes):
+                out_code.write('%s\t%4d\t%s\t%4d\n' %(label, value, cat, j+1))
+            if response != '':
+                out_response.write('%s\t%s\n' %(label, response))
+
+    with open(p('condition.csv'), 'w+') as out_condition, open(p('loop.csv'), 'w+') as out_loop:
+        out_condition.write('Label\n')
+        out_loop.write('Label\n')
+        for item_type, text, offset in conditions:
+            if item_type == 'condition':
+                out_condition.write('%s\n' %(text))
+            elif item_type == 'loop':
+                out_loop.write('%s\n' %(text))
+
+
+def record_row(record):
+    """
+    JSON row of a record: [type, fields ...], the codes of a question as [[value, category], ...]
+    """
+    if type(record) is Question:
+        return ['question', record.label, record.question, record.instruction, record.codes, record.response, record.offset]
+    if type(record) is Condition:
+        return ['condition', record.kind, record.text, record.offset]
+    if type(record) is Loop:
+        return ['loop', record.text, record.offset, record.end]
+    return ['sequence', record.text, record.offset]
+
+
+def write_segments(path, sequences, labels, questions, conditions, header=None):
+    """
+    records -> JSONL file: a header line (profile, text length, page offsets, labels ...),
+    then one record per line, sequences, questions, conditions and loops
+    """
+    header = dict(header or {}, parser_version=parser_version, labels=labels)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(header, ensure_ascii=False) + '\n')
+        for records in (sequences, questions, conditions):
+            for record in records:
+                f.write(json.dumps(record_row(record), ensure_ascii=False) + '\n')
+    return path
+
+
+def read_segments(path, codelists=None):
+    """
+    JSONL file of write_segments -> header, sequences, labels, questions, conditions
+    codelists: optional CodeLists, the code lists read are interned in it
+    """
+    codelists = codelists if codelists is not None else CodeLists()
+    sequences, questions, conditions = [], [], []
+    with open(path, encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        for line in f:
+            row = json.loads(line)
+            if row[0] == 'question':
+                label, question, instruction, codes, response, offset = row[1:]
+                questions.append(Question(label, question, instruction, codelists.intern(map(tuple, codes)), response, offset))
+            elif row[0] == 'condition':
+                conditions.append(Condition(*row[1:]))
+            elif row[0] == 'loop':
+                conditions.append(Loop(*row[1:]))
+            else:
+                sequences.append(Sequence(*row[1:]))
+    if header.get('parser_version') != parser_version:
+        raise ValueError('%s: segments of parser version %s, not %s' % (path, header.get('parser_version'), parser_version))
+    return header, sequences, header['labels'], questions, conditions
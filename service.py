@@ -0,0 +1,239 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Local parse service: one long-running process that keeps the parser warm
+    - a pool of worker processes with the parser imported, the profiles compiled and a parse store in memory
+    - the cleaned text of recent pdf files in memory, by content hash and profile:
+      parsing the same pdf again skips the pdf extraction
+    - jobs are HTTP requests on localhost, handled concurrently, each one in a worker process
+    python3 service.py serve [--port 8642] [--workers N] [--cache-size 32]
+    python3 service.py parse PDF --profile NAME [--port 8642] [--document-order] [--compact] [--output FILE]
+    HTTP: POST /parse?profile=ncds[&document_order=1][&compact=1], the pdf as body -> ESRC file (TSV)
+          GET /status -> JSON: workers, documents in the text cache, jobs done
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+import urllib.error
+import urllib.request
+import argparse
+import io
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+from metrics import Metrics
+from profiles import profiles
+from text_cache import file_hash
+
+
+default_port = 8642
+
+# parse store of a worker process, in memory, see init_worker
+worker_store = None
+
+
+def init_worker():
+    """
+    runs once in each worker process: the parser (and pandas) is imported before the first job,
+    the client does not import it
+    """
+    global worker_store
+    import api
+    from parse_store import ParseStore
+    from segment import parser_version
+    worker_store = ParseStore(':memory:', parser_version=parser_version)
+
+
+def parse_job(pdf, profile_name, document_order=False, compact=False, text=None, page_offsets=None):
+    """
+    in a worker process: extract the pdf, unless its text is given, then parse it
+    output: text and page offsets if extracted here (else None, None), ESRC TSV, metrics
+    """
+    from api import extract_text, parse_questionnaire_text
+    from esrc_io import write_esrc
+    metrics = Metrics()
+    extracted = text is None
+    if extracted:
+        text, page_offsets = extract_text(pdf, profile_name, metrics=metrics)
+    df_all = parse_questionnaire_text(text, profile_name, page_offsets, document_order, compact, worker_store, metrics)
+    esrc = io.StringIO()
+    write_esrc(df_all, esrc)
+    if not extracted:
+        text, page_offsets = None, None
+    return text, page_offsets, esrc.getvalue(), metrics.to_dict()
+
+
+def warm_up(i):
+    return os.getpid()
+
+
+class ParseService:
+
+    def __init__(self, workers=None, cache_size=32):
+        """
+        workers: worker processes, default: number of CPUs
+        cache_size: number of cleaned texts kept in memory
+        """
+        self.workers = workers or os.cpu_count()
+        self.cache_size = cache_size
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker)
+        # (pdf hash, profile name) -> (cleaned text, page offsets), least recently used first
+        self.texts = OrderedDict()
+        self.lock = threading.Lock()
+        self.jobs = 0
+        self.text_hits = 0
+        self.started = time.time()
+        # start all workers now, not at the first jobs
+        list(self.pool.map(warm_up, range(self.workers)))
+
+    def parse(self, pdf, profile_name, document_order=False, compact=False):
+        """
+        input: pdf content (bytes), profile name
+        output: ESRC file content (TSV), metrics of the job
+        """
+        key = (file_hash(pdf), profile_name)
+        with self.lock:
+            cached = self.texts.get(key)
+            if cached is not None:
+                self.texts.move_to_end(key)
+        if cached is not None:
+            future = self.pool.submit(parse_job, None, profile_name, document_order, compact, *cached)
+        else:
+            future = self.pool.submit(parse_job, pdf, profile_name, document_order, compact)
+        text, page_offsets, esrc, metrics = future.result()
+
+        with self.lock:
+            self.jobs += 1
+            if cached is not None:
+                self.text_hits += 1
+            elif self.cache_size > 0:
+                self.texts[key] = (text, page_offsets)
+                while len(self.texts) > self.cache_size:
+                    self.texts.popitem(last=False)
+        metrics['counters']['text_cache_hit'] = cached is not None
+        return esrc, metrics
+
+    def status(self):
+        with self.lock:
+            return {'workers': self.workers, 'cached_texts': len(self.texts), 'cache_size': self.cache_size,
+                    'jobs': self.jobs, 'text_cache_hits': self.text_hits, 'uptime_seconds': round(time.time() - self.started, 3)}
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def send_body(self, body, content_type, headers=()):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/status':
+            self.send_error(404)
+            return
+        self.send_body(json.dumps(self.server.service.status()).encode('utf-8'), 'application/json')
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/parse':
+            self.send_error(404)
+            return
+        query = parse_qs(url.query)
+        flag = lambda name: query.get(name, ['0'])[0] not in ('', '0', 'false')
+        profile_name = query.get('profile', [''])[0]
+        if profile_name not in profiles:
+            self.send_error(400, 'unknown profile %r, one of %s' % (profile_name, ', '.join(sorted(profiles))))
+            return
+        pdf = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            esrc, metrics = self.server.service.parse(pdf, profile_name, flag('document_order'), flag('compact'))
+        except Exception as e:
+            self.send_error(500, '%s: %s' % (type(e).__name__, e))
+            return
+        seconds = sum(s['wall_seconds'] for s in metrics['stages'].values())
+        self.send_body(esrc.encode('utf-8'), 'text/tab-separated-values; charset=utf-8',
+                       [('X-Parse-Seconds', '%.6f' % seconds),
+                        ('X-Text-Cache', 'hit' if metrics['counters']['text_cache_hit'] else 'miss')])
+
+
+def serve(port=default_port, workers=None, cache_size=32):
+    """
+    run the service on localhost until interrupted or terminated
+    """
+    # the port first: a port in use fails before the workers start
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    service = server.service = ParseService(workers, cache_size)
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+    print('parse service on http://127.0.0.1:%d, %d workers' % (port, service.workers), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+def request_parse(pdf_file, profile_name, port=default_port, document_order=False, compact=False):
+    """
+    client: send a pdf file to the service
+    output: ESRC file content (TSV), response headers
+    """
+    with open(pdf_file, 'rb') as f:
+        pdf = f.read()
+    query = urlencode({'profile': profile_name, 'document_order': int(document_order), 'compact': int(compact)})
+    request = urllib.request.Request('http://127.0.0.1:%d/parse?%s' % (port, query), data=pdf,
+                                     headers={'Content-Type': 'application/pdf'})
+    with urllib.request.urlopen(request) as response:
+        return response.read().decode('utf-8'), dict(response.headers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local parse service with warm worker processes')
+    commands = parser.add_subparsers(dest='command', required=True)
+    p = commands.add_parser('serve', help='run the service')
+    p.add_argument('--port', type=int, default=default_port)
+    p.add_argument('--workers', type=int, help='default: number of CPUs')
+    p.add_argument('--cache-size', type=int, default=32, help='cleaned texts kept in memory')
+    p = commands.add_parser('parse', help='parse a pdf with the running service')
+    p.add_argument('pdf')
+    p.add_argument('--profile', required=True, choices=sorted(profiles))
+    p.add_argument('--port', type=int, default=default_port)
+    p.add_argument('--document-order', action='store_true')
+    p.add_argument('--compact', action='store_true')
+    p.add_argument('--output', help='ESRC file, default: standard output')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(args.port, args.workers, args.cache_size)
+        return
+    try:
+        esrc, headers = request_parse(args.pdf, args.profile, args.port, args.document_order, args.compact)
+    except urllib.error.HTTPError as e:
+        sys.exit('%s: %s %s' % (args.pdf, e.code, e.reason))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(esrc)
+        print('%s (%s s, text cache %s)' % (args.output, headers.get('X-Parse-Seconds'), headers.get('X-Text-Cache')))
+    else:
+        sys.stdout.write(esrc)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Shadow run: the legacy parsers and the new ones side by side on the same extracted text
+    - legacy: legacy/parse_*_pdf_esrc.py, the scripts as they were before engine.py
+    - engine: engine.parse_questionnaire from the text file
+    - api: api.parse_questionnaire_text, the text in memory
+    - segments: segment.py records through the JSONL file and back, as cli.py segment / assemble
+    The ESRC files are compared with the baseline one (legacy by default) item by item
+    (item_type, content, in order), the time of each stage is reported with the speedup over the baseline.
+    fixtures/*.txt: text of NCDS Age 42 and both ELSA waves, so it runs offline without the pdf files:
+    synthetic questionnaires, and hand-written text of the layouts they do not have (fixtures/*_layouts.txt).
+    python3 shadow.py [profile ...] [--engines engine api segments] [--baseline legacy|engine] [--text PROFILE=FILE] [--report FILE.json]
+    The span index is also checked on the label pairs of fixtures/span_cases.json against the legacy regex.
+    exits with 1 when an ESRC file differs from the baseline one, or a span from the legacy one
+"""
+
+import argparse
+import csv
+import difflib
+import importlib.util
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+from api import parse_questionnaire_text
+from engine import get_esrc, parse_questionnaire
+from esrc_io import write_esrc
+from metrics import Metrics
+from profiles import profiles
+from segment import parse_text, read_segments, write_segments
+from span_index import SpanIndex
+from text_store import TextStore
+
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# legacy script of each profile
+legacy_scripts = {
+    'ncds': 'parse_ncds_pdf_esrc.py',
+    'elsa_wave1': 'parse_elsa_wave1_pdf_esrc.py',
+    'elsa_wave2': 'parse_elsa_wave2_pdf_esrc.py',
+}
+
+# extracted text of each profile, checked in
+fixtures = {
+    'ncds': 'fixtures/ncds_age_42.txt',
+    'elsa_wave1': 'fixtures/elsa_wave1.txt',
+    'elsa_wave2': 'fixtures/elsa_wave2_nurse.txt',
+}
+
+# hand-written text of each profile: the NCDS Hospital alias, labels inside longer labels,
+# '_N' labels, instructions that span lines, not in the synthetic fixtures
+layout_fixtures = {
+    'ncds': 'fixtures/ncds_layouts.txt',
+    'elsa_wave1': 'fixtures/elsa_wave1_layouts.txt',
+    'elsa_wave2': 'fixtures/elsa_wave2_layouts.txt',
+}
+
+# label pairs of short texts, the span index is checked against the regex of the legacy scripts
+span_cases = 'fixtures/span_cases.json'
+
+# fixtures/*.txt are synthetic.py text of this many questions, see write_fixtures
+fixture_questions = 300
+
+# stages compared, and the stages of the new parsers in each
+stages = [
+    ('get_sequence', ['tokenize', 'get_sequence']),
+    ('generate_code_list', ['generate_code_list']),
+    ('get_condition', ['get_condition']),
+    ('get_esrc', ['read_segments', 'write_segments', 'get_esrc']),
+    ('write_esrc', ['write_esrc']),
+]
+
+
+# legacy scripts loaded so far, by profile name
+legacy_modules = {}
+
+
+def load_legacy(profile_name):
+    """
+    legacy script of the profile as a module, loaded once
+    """
+    if profile_name not in legacy_modules:
+        path = os.path.join(here, 'legacy', legacy_scripts[profile_name])
+        spec = importlib.util.spec_from_file_location('legacy_' + profile_name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        legacy_modules[profile_name] = module
+    return legacy_modules[profile_name]
+
+
+def run_legacy(profile, txt_file, output_dir, metrics):
+    return load_legacy(profile.name).text_to_esrc(txt_file, output_dir, 'ESRC.csv', metrics)
+
+
+def run_engine(profile, txt_file, output_dir, metrics):
+    # page offsets given: the text is already extracted
+    return parse_questionnaire(profile, txt_file, txt_file, output_dir, 'ESRC.csv', page_offsets=[0], metrics=metrics)
+
+
+def run_api(profile, txt_file, output_dir, metrics):
+    with open(txt_file, encoding='utf-8') as f:
+        text = f.read()
+    df_all = parse_questionnaire_text(text, profile, metrics=metrics)
+    esrc_file = os.path.join(output_dir, 'ESRC.csv')
+    with metrics.stage('write_esrc'):
+        write_esrc(df_all, esrc_file)
+    return esrc_file
+
+
+def run_segments(profile, txt_file, output_dir, metrics):
+    segments_file = os.path.join(output_dir, 'segments.jsonl')
+    with TextStore(txt_file) as content:
+        sequences, labels, questions, conditions = parse_text(content, profile, metrics=metrics)
+    with metrics.stage('write_segments'):
+        write_segments(segments_file, sequences, labels, questions, conditions)
+    with metrics.stage('read_segments'):
+        header, sequences, labels, questions, conditions = read_segments(segments_file)
+    with metrics.stage('get_esrc'):
+        df_all = get_esrc(sequences, questions, conditions)
+    esrc_file = os.path.join(output_dir, 'ESRC.csv')
+    with metrics.stage('write_esrc'):
+        write_esrc(df_all, esrc_file)
+    return esrc_file
+
+
+engines = {'legacy': run_legacy, 'engine': run_engine, 'api': run_api, 'segments': run_segments}
+
+
+def read_items(esrc_file):
+    """
+    (item_type, content) of each row of an ESRC file
+    """
+    with open(esrc_file, newline='', encoding='utf-8') as f:
+        rows = csv.reader(f, delimiter='\t')
+        columns = next(rows)
+        i, j = columns.index('item_type'), columns.index('content')
+        return [(row[i], row[j]) for row in rows]
+
+
+def diff_items(old, new):
+    """
+    input: items of the baseline and the new ESRC file
+    output: list of differences {'op', 'baseline': [[row, item_type, content]], 'new': [...]}, rows from 1
+    """
+    if old == new:
+        return []
+    differences = []
+    for op, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if op != 'equal':
+            differences.append({'op': op,
+                                'baseline': [[i + 1, *old[i]] for i in range(i1, i2)],
+                                'new': [[j + 1, *new[j]] for j in range(j1, j2)]})
+    return differences
+
+
+def stage_seconds(metrics):
+    """
+    wall seconds of each compared stage
+    """
+    seconds = {}
+    for name, parts in stages:
+        seconds[name] = sum(metrics.stages[part]['wall_seconds'] for part in parts if part in metrics.stages)
+    return seconds
+
+
+def run(profile, txt_file, output_dir, engine, repeat=1):
+    """
+    best of repeat runs
+    output: ESRC file, stage seconds, total seconds
+    """
+    best = None
+    for _ in range(repeat):
+        metrics = Metrics(txt_file)
+        start = time.perf_counter()
+        esrc_file = engines[engine](profile, txt_file, os.path.join(output_dir, engine), metrics)
+        total = time.perf_counter() - start
+        if best is None or total < best[2]:
+            best = (esrc_file, stage_seconds(metrics), total)
+    return best
+
+
+def fixture_texts(profile_names=None):
+    """
+    {case name: (profile name, text file)} of the checked-in fixtures, the ones of profile_names or all
+    """
+    texts = {}
+    for profile_name in profile_names or fixtures:
+        texts[profile_name] = (profile_name, os.path.join(here, fixtures[profile_name]))
+        texts[profile_name + '_layouts'] = (profile_name, os.path.join(here, layout_fixtures[profile_name]))
+    return texts
+
+
+def shadow(texts, names=('engine', 'api', 'segments'), baseline='legacy', repeat=1, output_dir=None):
+    """
+    input: {case name: (profile name, extracted text file)}, new parsers to compare with the baseline parser
+    output: report {case name: {'profile', 'text', 'baseline', 'items', parser: {'seconds', 'total_seconds', 'speedup', 'differences'}}}
+    """
+    names = [name for name in names if name != baseline]
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        output_dir = output_dir or tmp
+        for case, (profile_name, txt_file) in texts.items():
+            profile = profiles[profile_name]
+            # not in the time of the first run
+            load_legacy(profile_name)
+            base = os.path.join(output_dir, case)
+            for engine in [baseline] + names:
+                os.makedirs(os.path.join(base, engine), exist_ok=True)
+            baseline_file, baseline_seconds, baseline_total = run(profile, txt_file, base, baseline, repeat)
+            baseline_items = read_items(baseline_file)
+            result = report[case] = {'profile': profile_name, 'text': txt_file, 'baseline': baseline, 'items': len(baseline_items),
+                                     baseline: {'seconds': baseline_seconds, 'total_seconds': baseline_total}}
+            for engine in names:
+                esrc_file, seconds, total = run(profile, txt_file, base, engine, repeat)
+                speedup = {name: baseline_seconds[name] / s if s > 0 else None for name, s in seconds.items()}
+                speedup['total'] = baseline_total / total if total > 0 else None
+                result[engine] = {'seconds': seconds, 'total_seconds': total, 'speedup': speedup,
+                                  'differences': diff_items(baseline_items, read_items(esrc_file))}
+    return report
+
+
+def compared(result):
+    """
+    parsers compared with the baseline in the report of one text
+    """
+    return [name for name in result if name not in ('profile', 'text', 'baseline', 'items', result['baseline'])]
+
+
+def legacy_span(profile, text, label_1, label_2):
+    """
+    text between two labels as the legacy scripts found it (first match), None if not found
+    """
+    pattern = profile.label_lead + re.escape(label_1) + profile.label_open + '(.*?)' + re.escape(label_2) + profile.label_close
+    found = re.findall(pattern, text, re.DOTALL)
+    return found[0] if found else None
+
+
+def check_spans(profile_names=None, path=span_cases):
+    """
+    SpanIndex on each case of fixtures/span_cases.json, on the text and on its TextStore
+    output: list of the cases where it differs from the legacy regex {'case', 'profile', 'pair', 'legacy', 'index'}
+    """
+    with open(os.path.join(here, path), encoding='utf-8') as f:
+        cases = json.load(f)
+    differences = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for case in cases:
+            if profile_names and case['profile'] not in profile_names:
+                continue
+            p = profiles[case['profile']]
+            expected = legacy_span(p, case['text'], *case['pair'])
+            txt_file = os.path.join(tmp, 'span.txt')
+            with open(txt_file, 'w', encoding='utf-8', newline='') as f:
+                f.write(case['text'])
+            with TextStore(txt_file) as store:
+                for content in (case['text'], store):
+                    found = SpanIndex(content, case['labels'], p.label_lead, p.label_open, p.label_close).between(*case['pair'])
+                    if found != expected:
+                        differences.append({'case': case['case'], 'profile': p.name, 'pair': case['pair'],
+                                            'legacy': expected, 'index': found})
+    return differences
+
+
+def print_report(report, show=10, out=sys.stdout):
+    for case, result in report.items():
+        baseline = result['baseline']
+        names = compared(result)
+        print('%s (%s): %s, %d items in the %s ESRC file' % (case, result['profile'], result['text'], result['items'], baseline), file=out)
+        print('  %-20s %10s' % ('stage (s)', baseline) + ''.join(' %20s' % name for name in names), file=out)
+        rows = [name for name, parts in stages] + ['total']
+        for stage in rows:
+            key = (lambda r: r['total_seconds']) if stage == 'total' else (lambda r: r['seconds'][stage])
+            line = '  %-20s %10.4f' % (stage, key(result[baseline]))
+            for name in names:
+                speedup = result[name]['speedup'][stage]
+                line += ' %10.4f %8s' % (key(result[name]), '%.1fx' % speedup if speedup else '-')
+            print(line, file=out)
+        for name in names:
+            differences = result[name]['differences']
+            if not differences:
+                print('  %s: identical' % name, file=out)
+                continue
+            changed = sum(max(len(d['baseline']), len(d['new'])) for d in differences)
+            print('  %s: %d differences, %d items' % (name, len(differences), changed), file=out)
+            for d in differences[:show]:
+                for side in ('baseline', 'new'):
+                    for row, item_type, content in d[side]:
+                        content = content.replace('\n', '\\n')[:100]
+                        print('    %s %-7s %6d %s: %s' % ('-' if side == 'baseline' else '+', d['op'], row, item_type, content), file=out)
+
+
+def write_fixtures(n_questions=fixture_questions):
+    """
+    regenerate the synthetic fixtures/*.txt, questionnaires in the layout of each profile (synthetic.py)
+    the hand-written fixtures/*_layouts.txt are kept
+    """
+    from synthetic import synthetic_text
+    for profile_name, path in fixtures.items():
+        path = os.path.join(here, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(synthetic_text(profile_name, n_questions))
+        print(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the new parsers with the legacy scripts on the same text')
+    parser.add_argument('names', nargs='*', metavar='profile', help='%s, default: all' % ', '.join(sorted(fixtures)))
+    parser.add_argument('--engines', nargs='+', choices=[name for name in engines if name != 'legacy'],
+                        default=['engine', 'api', 'segments'])
+    parser.add_argument('--baseline', choices=['legacy', 'engine'], default='legacy',
+                        help='parser the others are compared with, engine: check new paths against the current engine')
+    parser.add_argument('--text', action='append', default=[], metavar='PROFILE=FILE',
+                        help='extracted text of a profile instead of its fixtures, e.g. ncds=NCDS_all_pages.txt')
+    parser.add_argument('--repeat', type=int, default=1, help='runs of each parser, the best one counts')
+    parser.add_argument('--show', type=int, default=10, help='differences shown per parser')
+    parser.add_argument('--report', help='write the report to this JSON file')
+    parser.add_argument('--output-dir', help='keep the ESRC files here, default: a temporary directory')
+    parser.add_argument('--write-fixtures', action='store_true', help='regenerate fixtures/*.txt and exit')
+    args = parser.parse_args()
+
+    if args.write_fixtures:
+        write_fixtures()
+        return
+    for name in args.names:
+        if name not in fixtures:
+            parser.error('unknown profile %s' % name)
+    texts = fixture_texts(args.names)
+    for item in args.text:
+        name, _, path = item.partition('=')
+        if name not in fixtures or not path:
+            parser.error('--text %s: PROFILE=FILE, profile one of %s' % (item, ', '.join(sorted(fixtures))))
+        texts = {case: text for case, text in texts.items() if text[0] != name}
+        texts[name] = (name, path)
+    if args.names:
+        texts = {case: text for case, text in texts.items() if text[0] in args.names}
+
+    report = shadow(texts, args.engines, args.baseline, args.repeat, args.output_dir)
+    print_report(report, args.show)
+    spans = check_spans(args.names)
+    print('span index: %s' % ('same spans as the legacy regex' if not spans else '%d cases differ' % len(spans)))
+    for d in spans:
+        print('  %s (%s %s..%s): legacy %r, index %r' % (d['case'], d['profile'], d['pair'][0], d['pair'][1], d['legacy'], d['index']))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=1)
+    if spans or any(result[name]['differences'] for result in report.values() for name in compared(result)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Single pass label index over the cleaned questionnaire text
+    - find every question label offset in one scan, also labels inside longer labels
+    - look up the text between two labels without re-reading / re-searching the whole file
+    - the text is a str, or a TextStore: then the scan and the checks run on the mapped bytes
+"""
+
+import re
+from bisect import bisect_left
+
+from text_store import TextStore, bytes_pattern
+
+
+def trie_pattern(keys):
+    """
+    regex matching any of keys, the longest one at a given offset
+    built as a prefix tree, so a scan does not try every key at every offset
+    """
+    trie = {}
+    for key in keys:
+        node = trie
+        for c in key:
+            node = node.setdefault(c, {})
+        node[''] = {}
+    return _node_pattern(trie)
+
+
+def _node_pattern(node):
+    # '' marks the end of a key, the longer keys are tried first (greedy '?')
+    branches = [re.escape(c) + _node_pattern(child) for c, child in sorted(node.items()) if c]
+    if not branches:
+        return ''
+    pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if '' in node:
+        pattern = '(?:' + pattern + ')?'
+    return pattern
+
+
+def trie_bytes_pattern(keys):
+    """
+    trie_pattern on the UTF-8 bytes of keys (latin-1 maps every byte to one character)
+    """
+    return trie_pattern(key.encode('utf-8').decode('latin-1') for key in keys).encode('latin-1')
+
+
+class SpanIndex:
+    """
+    label -> sorted list of (start, end) offsets in content
+
+    lead:  text that must directly precede the first label of a pair (e.g. '\n')
+    open:  pattern that must follow the first label, the span body starts after it
+    close: pattern that must follow the second label
+    with a TextStore, offsets are byte offsets, last_start is a str offset
+    """
+
+    def __init__(self, content, labels, lead='', open=r'\s*', close=''):
+        self.store = content if isinstance(content, TextStore) else None
+        if self.store is not None:
+            self.content = self.store.buffer
+            self.lead = lead.encode('utf-8')
+            self.open = re.compile(bytes_pattern(open))
+            self.close = re.compile(bytes_pattern(close))
+        else:
+            self.content = content
+            self.lead = lead
+            self.open = re.compile(open)
+            self.close = re.compile(close)
+
+        # every offset is tried (the lookahead does not consume the text), the longest label there
+        # is matched, then each shorter label it starts with is recorded too: 'A1' in 'A12',
+        # 'Hospital' in 'Hospital  YES/NO', as a regex search for the label would find them
+        keys = set(label for label in labels if label)
+        self.offsets = {key: [] for key in keys}
+        prefixes = {key: [key[:j] for j in range(1, len(key) + 1) if key[:j] in keys] for key in keys}
+        if keys and self.store is not None:
+            by_bytes = {key.encode('utf-8'): key for key in keys}
+            for m in self.store.finditer(re.compile(b'(?=(' + trie_bytes_pattern(keys) + b'))')):
+                start = m.start()
+                for key in prefixes[by_bytes[m.group(1)]]:
+                    self.offsets[key].append((start, start + len(key.encode('utf-8'))))
+        elif keys:
+            pattern = re.compile('(?=(' + trie_pattern(keys) + '))')
+            for m in pattern.finditer(content):
+                start = m.start()
+                for key in prefixes[m.group(1)]:
+                    self.offsets[key].append((start, start + len(key)))
+        self.starts = {key: [s for s, e in v] for key, v in self.offsets.items()}
+
+        # labels are visited in document order, occurrences before the cursor are used up
+        self.cursor = 0
+        # offset of the first label of the last span found
+        self.last_start = None
+        # label occurrences checked, spans found
+        self.checks = 0
+        self.found = 0
+
+    def duplicates(self):
+        """
+        labels found more than once in the text
+        """
+        return {key: v for key, v in self.offsets.items() if len(v) > 1}
+
+    def _first(self, label, pos, check):
+        starts = self.starts.get(label, [])
+        for i in range(bisect_left(starts, pos), len(starts)):
+            start, end = self.offsets[label][i]
+            self.checks += 1
+            m = check(start, end)
+            if m is not None:
+                return start, m
+        return None
+
+    def _check_first(self, start, end):
+        if self.lead:
+            # a label at the start of the text has no lead before it
+            if start < len(self.lead) or self.content[start - len(self.lead):start] != self.lead:
+                return None
+        m = self.open.match(self.content, end)
+        return None if m is None else m.end()
+
+    def _check_second(self, start, end):
+        m = self.close.match(self.content, end)
+        return None if m is None else start
+
+    def span(self, label_1, label_2):
+        """
+        (start, end) of the text between label_1 and the next label_2, None if not found
+        """
+        found = self._first(label_1, self.cursor, self._check_first)
+        if found is None:
+            # label already used up (e.g. listed twice), fall back to the first occurrence
+            found = self._first(label_1, 0, self._check_first)
+        if found is None:
+            return None
+        start_1, body_start = found
+
+        found = self._first(label_2, body_start, self._check_second)
+        if found is None:
+            return None
+        self.cursor = start_1
+        self.last_start = start_1 if self.store is None else self.store.char_offset(start_1)
+        self.found += 1
+        return body_start, found[0]
+
+    def between(self, label_1, label_2):
+        """
+        text between label_1 and label_2, None if not found
+        """
+        self.last_start = None
+        span = self.span(label_1, label_2)
+        if span is None:
+            return None
+        if self.store is not None:
+            return self.store.slice(*span)
+        return self.content[span[0]:span[1]]
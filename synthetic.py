@@ -0,0 +1,159 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Synthetic questionnaires in the layout of each profile, for benchmarks
+    - cleaned text, as pdf_to_text would write it
+    - optionally a pdf (needs reportlab), with cover pages, titles and page numbers
+    Same profile, size and seed give the same questionnaire.
+"""
+
+import random
+
+
+words = ['how', 'many', 'people', 'live', 'in', 'this', 'household', 'do', 'you', 'have', 'any',
+         'work', 'health', 'money', 'last', 'week', 'month', 'year', 'your', 'the', 'other',
+         'income', 'pension', 'hospital', 'doctor', 'school', 'children', 'partner', 'house']
+
+categories = ['Yes', 'No', 'Married', 'Single', 'Divorced', 'Widowed', 'Very good', 'Good', 'Fair',
+              'Bad', 'Very bad', "Don't know", 'Refused', 'Other (specify)']
+
+# layout of each profile: how sections, labels, codes, responses, conditions and loops look
+styles = {
+    'ncds': {
+        'section': 'Section %s %s',
+        'label': '? %s %s',
+        'inline_responses': ['YES/NO', 'AGE', 'TEXT[40]', '1..20', '', '', ''],
+        'responses': [],
+        'code': '(%d) %s',
+        'instruction': '[ask all] ',
+        'condition': 'IF %s = %d THEN',
+        'elseif': 'ELSEIF %s = %d THEN',
+        'else': 'ELSE',
+        'endif': 'ENDIF',
+        'loop': 'FOR Loop %s',
+        'endloop': 'END LOOP',
+    },
+    'elsa_wave1': {
+        'section': '%s %s Module',
+        'label': '%s',
+        'inline_responses': [],
+        'responses': ['Range 1..20', 'Text 40', 'Range 0..120', None, None],
+        'code': '%d   %s',
+        'instruction': 'INTERVIEWER: check this...',
+        'condition': 'IF %s = %d',
+        'elseif': 'ELSEIF %s = %d',
+        'else': 'ELSE',
+        'endif': 'ENDIF',
+        'loop': 'repeat for each %s',
+        'endloop': 'END LOOP',
+    },
+    'elsa_wave2': {
+        'section': '%s %s Section',
+        'label': '%s',
+        'inline_responses': [],
+        'responses': ['Range 1..20', 'Text 40', 'Range 0..120', None, None],
+        'code': '%d %s',
+        'instruction': '[Loop: each %s]',
+        'condition': 'IF %s = %d',
+        'elseif': 'ELSEIF %s = %d',
+        'else': 'ELSE',
+        'endif': 'ENDIF',
+        'loop': 'LOOP FOR %s',
+        'endloop': 'END LOOP',
+    },
+}
+
+
+def question_lines(style, label, r):
+    """
+    lines of one question: label, optional instruction, text, code list or response
+    """
+    s = style
+    if s['inline_responses']:
+        lines = [(s['label'] % (label, r.choice(s['inline_responses']))).rstrip()]
+    else:
+        lines = [s['label'] % label]
+    text = ' '.join(r.choice(words) for _ in range(r.randrange(4, 14))).capitalize() + '?'
+    if r.random() < 0.2:
+        instruction = s['instruction'] % r.choice(words) if '%s' in s['instruction'] else s['instruction']
+        lines.append(instruction)
+    lines.append(text)
+    if r.random() < 0.5:
+        for value, cat in enumerate(r.sample(categories, r.randrange(2, 7))):
+            lines.append(s['code'] % (value + 1, cat))
+    elif s['responses']:
+        response = r.choice(s['responses'])
+        if response:
+            lines.append(response)
+    lines.append('')
+    return lines
+
+
+def synthetic_lines(profile_name, n_questions, seed=0, section_size=50):
+    """
+    input: profile name, number of questions
+    output: list of text lines, with sections, nested conditions and loops
+    """
+    s = styles[profile_name]
+    r = random.Random(seed)
+    lines = []
+    open_blocks = []
+    for i in range(n_questions):
+        label = 'Q%s%06d' % (r.choice('ABCDEFGH'), i)
+        if i % section_size == 0:
+            for kind in reversed(open_blocks):
+                lines += [s[kind], '']
+            open_blocks = []
+            section = ' '.join(r.choice(words) for _ in range(2)).title()
+            lines += [s['section'] % ('ABCDEFGHJKLMN'[(i // section_size) % 13], section), '']
+        k = r.random()
+        if k < 0.10 and len(open_blocks) < 3:
+            lines += [s['condition'] % (label, r.randrange(1, 5)), '']
+            open_blocks.append('endif')
+        elif k < 0.13 and open_blocks and open_blocks[-1] == 'endif':
+            lines += [s['elseif'] % (label, r.randrange(1, 5)) if r.random() < 0.5 else s['else'], '']
+        elif k < 0.16 and len(open_blocks) < 3:
+            lines += [s['loop'] % r.choice(words), '']
+            open_blocks.append('endloop')
+        elif k < 0.26 and open_blocks:
+            lines += [s[open_blocks.pop()], '']
+        lines += question_lines(s, label, r)
+    for kind in reversed(open_blocks):
+        lines += [s[kind], '']
+    return lines
+
+
+def synthetic_text(profile_name, n_questions, seed=0):
+    """
+    cleaned questionnaire text, as written by pdf_to_text
+    """
+    return '\n'.join(synthetic_lines(profile_name, n_questions, seed)) + '\n\n'
+
+
+def synthetic_pdf(profile, n_questions, pdf_file, seed=0, lines_per_page=60):
+    """
+    write a pdf of the synthetic questionnaire: cover pages up to profile.first_page,
+    profile title at the top and page number at the bottom of every page
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    lines = synthetic_lines(profile.name, n_questions, seed)
+    pages = [['Synthetic questionnaire'] for _ in range(profile.first_page - 1)]
+    pages += [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)]
+
+    width, height = A4
+    c = canvas.Canvas(pdf_file, pagesize=A4)
+    for n, page in enumerate(pages, 1):
+        c.setFont('Helvetica', 9)
+        if profile.title:
+            c.drawString(40, height - 30, profile.title)
+        y = height - 50
+        for line in page:
+            c.drawString(40, y, line)
+            y -= 12
+        c.drawString(width / 2, 25, str(n))
+        c.showPage()
+    c.save()
+    return pdf_file
@@ -0,0 +1,142 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Disk cache for raw and cleaned pdf page text
+    - key: pdf content hash, page number, cleaning function and its arguments
+    - each entry is a gzip file, least recently used entries are removed
+      when the cache is over its size limit
+    Also the file hash and JSON manifests of batch.py and modify.py: a file is unchanged when
+    its size and mtime, or else its content hash, are the ones in its manifest entry.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+
+
+default_cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'esrc_questionnaire')
+
+
+def file_hash(path, block_size=1 << 20):
+    """
+    sha256 of the file content, path can also be the content (bytes)
+    """
+    if isinstance(path, bytes):
+        return hashlib.sha256(path).hexdigest()
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_state(path):
+    """
+    hash, size and mtime of a file, for its manifest entry
+    """
+    stat = os.stat(path)
+    return {'hash': file_hash(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def same_file(entry, path):
+    """
+    the file is the one of the manifest entry: same size and mtime, else same content hash
+    """
+    stat = os.stat(path)
+    if entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+        return True
+    return entry.get('hash') == file_hash(path)
+
+
+def load_manifest(manifest_file):
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, manifest_file):
+    """
+    write the JSON file through a temporary file, a reader never sees half of it
+    """
+    tmp = manifest_file + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, manifest_file)
+
+
+def clean_fingerprint(clean, args=()):
+    """
+    identify a cleaning function by name, code and arguments (title, ...),
+    so that changing the strip rules or the first page cut-off changes the key
+    """
+    code = clean.__code__
+    h = hashlib.sha256()
+    h.update(('%s.%s' % (clean.__module__, clean.__qualname__)).encode())
+    h.update(code.co_code)
+    h.update(repr(code.co_consts).encode())
+    h.update(repr(args).encode())
+    return h.hexdigest()
+
+
+class PageCache:
+    """
+    get/put text by key tuple, e.g. (pdf_hash, page_number, 'raw')
+    """
+
+    def __init__(self, cache_dir=default_cache_dir, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.size = sum(e.stat().st_size for e in os.scandir(cache_dir) if e.name.endswith('.gz'))
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def _path(self, key):
+        name = hashlib.sha256(repr(key).encode()).hexdigest()
+        return os.path.join(self.cache_dir, name + '.gz')
+
+    def has(self, *key):
+        return os.path.exists(self._path(key))
+
+    def get(self, *key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                text = gzip.decompress(f.read()).decode('utf-8')
+        except (FileNotFoundError, OSError, EOFError):
+            return None
+        # mark as recently used
+        os.utime(path)
+        return text
+
+    def put(self, text, *key):
+        path = self._path(key)
+        data = gzip.compress(text.encode('utf-8'))
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp, path)
+        self.size += len(data) - old_size
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        remove least recently used entries until the cache is within max_bytes
+        """
+        entries = [e for e in os.scandir(self.cache_dir) if e.name.endswith('.gz')]
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        self.size = sum(e.stat().st_size for e in entries)
+        for e in entries:
+            if self.size <= self.max_bytes:
+                break
+            size = e.stat().st_size
+            try:
+                os.remove(e.path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
@@ -0,0 +1,144 @@
+#!/bin/env python3
+
+"""
+    Python 3
+    Read-only, memory-mapped view of a cleaned UTF-8 text file (_all_pages.txt)
+    - the file is mapped once, slices and byte regex searches read from the mapping
+    - processes that open the same file share the same pages of the OS file cache,
+      a TextStore sent to a worker process is mapped again there, not copied
+    Offsets into the mapping are byte offsets, char_offset converts them to str offsets.
+"""
+
+from array import array
+from bisect import bisect_right
+import io
+import mmap
+import os
+import re
+
+
+# UTF-8 of everything str regexes match with \s
+utf8_whitespace = (rb'(?:[\t\n\x0b\x0c\r\x1c-\x1f ]|\xc2[\x85\xa0]|\xe1\x9a\x80|'
+                   rb'\xe2\x80[\x80-\x8a\xa8\xa9\xaf]|\xe2\x81\x9f|\xe3\x80\x80)')
+
+
+def bytes_pattern(pattern):
+    """
+    str regex -> bytes regex for UTF-8 text, \\s keeps matching the same characters
+    other classes (\\w, \\d, ., [...]) stay ASCII / single byte
+    """
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\' and i + 1 < len(pattern):
+            if pattern[i + 1] == 's':
+                out.append(utf8_whitespace)
+            else:
+                out.append(pattern[i:i + 2].encode('utf-8'))
+            i += 2
+            continue
+        out.append(c.encode('utf-8'))
+        i += 1
+    return b''.join(out)
+
+
+class TextStore:
+
+    # bytes between char offset checkpoints
+    checkpoint = 1024
+
+    def __init__(self, path):
+        self.path = path
+        self.size = os.path.getsize(path)
+        if self.size:
+            with open(path, 'rb') as f:
+                self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.buffer = b''
+        self.ascii = re.search(rb'[\x80-\xff]', self.buffer) is None
+        self._byte_marks = None
+        self._char_marks = None
+
+    def __reduce__(self):
+        # map the file again in the other process
+        return (TextStore, (self.path,))
+
+    def _marks(self):
+        """
+        (byte offset, char offset) every `checkpoint` bytes, at character boundaries
+        """
+        byte_marks = array('q', [0])
+        char_marks = array('q', [0])
+        b = 0
+        while b < self.size:
+            e = min(b + self.checkpoint, self.size)
+            # do not cut a UTF-8 sequence: move back over continuation bytes
+            while e < self.size and self.buffer[e] & 0xC0 == 0x80:
+                e -= 1
+            char_marks.append(char_marks[-1] + len(self.buffer[b:e].decode('utf-8')))
+            byte_marks.append(e)
+            b = e
+        self._byte_marks, self._char_marks = byte_marks, char_marks
+
+    def char_offset(self, byte_offset):
+        """
+        str offset of a byte offset (at a character boundary)
+        """
+        if self.ascii:
+            return byte_offset
+        if self._byte_marks is None:
+            self._marks()
+        k = bisect_right(self._byte_marks, byte_offset) - 1
+        start = self._byte_marks[k]
+        return self._char_marks[k] + len(self.buffer[start:byte_offset].decode('utf-8'))
+
+    def __len__(self):
+        """
+        length in characters, same as len() of the decoded text
+        """
+        return self.char_offset(self.size)
+
+    def slice(self, start, end):
+        """
+        decoded text between two byte offsets
+        """
+        return self.buffer[start:end].decode('utf-8')
+
+    def text(self):
+        return self.slice(0, self.size)
+
+    def finditer(self, pattern, start=0):
+        """
+        byte regex search over the mapping, pattern: compiled bytes regex
+        """
+        return pattern.finditer(self.buffer, start)
+
+    def lines(self):
+        """
+        generator of decoded lines, with their '\\n'
+        read through the file object, splitting lines in C is faster than from the mapping,
+        the pages come from the same OS file cache
+        """
+        with open(self.path, encoding='utf-8', newline='\n') as f:
+            yield from f
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def text_lines(content):
+    """
+    line iterator of a str or a TextStore
+    """
+    if isinstance(content, TextStore):
+        return content.lines()
+    return io.StringIO(content)
+